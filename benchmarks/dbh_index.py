@@ -0,0 +1,94 @@
+"""
+Compares looking up the DBH rows of each course by scanning the tables, which is how
+CourseService.get_course_data used to do it, with looking them up in a DBHIndex.
+
+Run with: python -m benchmarks.dbh_index
+"""
+
+import argparse
+import random
+import time
+
+from services.dbh_index import DBHIndex
+
+
+def build_dataset(row_count: int, courses_count: int, seed: int = 0):
+    random.seed(seed)
+    codes = [f"TST{number:04d}" for number in range(courses_count)]
+    courses = []
+    grades = []
+    while len(courses) + len(grades) < row_count:
+        code = random.choice(codes)
+        version = random.choice(["1", "1", "2"])
+        year = str(random.randint(2004, 2024))
+        semester = random.choice(["1", "3"])
+        courses.append(
+            {
+                "Emnekode": f"{code}-{version}",
+                "Årstall": year,
+                "Semester": semester,
+                "Status": "1",
+                "Avdelingskode": "194",
+            }
+        )
+        for letter in "ABCDEF":
+            grades.append(
+                {
+                    "Emnekode": f"{code}-{version}",
+                    "Årstall": year,
+                    "Semester": semester,
+                    "Karakter": letter,
+                    "Antall kandidater totalt": str(random.randint(0, 50)),
+                }
+            )
+    return codes, courses, grades
+
+
+def lookup_by_scan(code: str, courses, grades):
+    dbh_grades = [grade for grade in grades if f"{code}-" in grade["Emnekode"]]
+    dbh_course = [course for course in courses if f"{code}-" in course["Emnekode"]]
+    return dbh_course, dbh_grades
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--courses", type=int, default=6_000)
+    parser.add_argument(
+        "--scan-sample",
+        type=int,
+        default=100,
+        help="Number of courses to time with the scan, which is extrapolated to all",
+    )
+    arguments = parser.parse_args()
+
+    codes, courses, grades = build_dataset(arguments.rows, arguments.courses)
+    print(f"{len(courses) + len(grades)} rows, {len(codes)} course codes")
+
+    sample = codes[: arguments.scan_sample]
+    start = time.perf_counter()
+    scan_results = [lookup_by_scan(code, courses, grades) for code in sample]
+    scan_per_course = (time.perf_counter() - start) / len(sample)
+    print(
+        f"Scan:  {scan_per_course * 1000:.2f} ms per course, "
+        f"{scan_per_course * len(codes):.1f} s for all courses (extrapolated)"
+    )
+
+    start = time.perf_counter()
+    dbh_index = DBHIndex(courses, grades)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    index_results = [
+        (dbh_index.get_courses(code), dbh_index.get_grades(code)) for code in codes
+    ]
+    lookup_time = time.perf_counter() - start
+    print(
+        f"Index: {build_time:.3f} s to build, {lookup_time * 1000:.2f} ms for all lookups, "
+        f"{build_time + lookup_time:.3f} s total"
+    )
+
+    assert index_results[: len(sample)] == scan_results
+
+
+if __name__ == "__main__":
+    main()
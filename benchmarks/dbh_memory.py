@@ -0,0 +1,104 @@
+"""
+Measures peak memory of reading a DBH grade table response of growing size:
+
+- json: the whole body decoded with response.json(), like NSDClient.get_result_from_query
+- records: the streamed rows kept as DBHRecords, like the sync does
+- grouped: the streamed rows handled one course at a time and then dropped
+
+Run with: python -m benchmarks.dbh_memory
+"""
+
+import argparse
+import json
+import random
+import tracemalloc
+
+from clients.dbh_records import iter_dbh_records, iter_rows_by_course_code
+
+CHUNK_SIZE = 64 * 1024
+
+
+def generate_rows(row_count: int, seed: int = 0):
+    random.seed(seed)
+    for index in range(row_count):
+        course_number = index // 60
+        yield {
+            "Institusjonskode": "1150",
+            "Institusjonsnavn": "Norges teknisk-naturvitenskapelige universitet",
+            "Avdelingskode": f"{66 + course_number % 8}",
+            "Avdelingsnavn": "Fakultet for informasjonsteknologi og elektroteknikk",
+            "Emnekode": f"TST{course_number:05d}-1",
+            "Emnenavn": f"Testemne nummer {course_number}",
+            "Årstall": str(2004 + index % 60 // 6 * 2),
+            "Semester": random.choice(["1", "3"]),
+            "Semesternavn": "Høst",
+            "Karakter": "ABCDEF"[index % 6],
+            "Antall kandidater totalt": str(random.randint(0, 200)),
+            "Antall kandidater kvinner": str(random.randint(0, 100)),
+            "Antall kandidater menn": str(random.randint(0, 100)),
+        }
+
+
+def generate_chunks(row_count: int):
+    """
+    Yields the JSON body in chunks, like a streamed response does.
+    """
+    buffer = ["["]
+    size = 1
+    for index, row in enumerate(generate_rows(row_count)):
+        text = ("," if index else "") + json.dumps(row, ensure_ascii=False)
+        buffer.append(text)
+        size += len(text)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    buffer.append("]")
+    yield "".join(buffer)
+
+
+def read_json(row_count: int):
+    body = "".join(generate_chunks(row_count)).encode("utf-8")
+    return json.loads(body)
+
+
+def read_records(row_count: int):
+    return list(iter_dbh_records(generate_chunks(row_count)))
+
+
+def read_grouped(row_count: int):
+    courses = 0
+    for _, rows in iter_rows_by_course_code(
+        iter_dbh_records(generate_chunks(row_count))
+    ):
+        courses += len(rows) > 0
+    return courses
+
+
+def measure(function, row_count: int):
+    tracemalloc.start()
+    result = function(row_count)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[25_000, 50_000, 100_000, 200_000]
+    )
+    arguments = parser.parse_args()
+
+    print(f"{'rows':>8} {'json':>10} {'records':>10} {'grouped':>10}")
+    for row_count in arguments.rows:
+        peaks = [
+            measure(function, row_count)
+            for function in (read_json, read_records, read_grouped)
+        ]
+        print(f"{row_count:>8} " + " ".join(f"{peak:>8.1f}MB" for peak in peaks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Microbenchmarks of the extraction of course data from course pages, on the corpus of course pages in
+clients/course_page_corpus, see clients/corpus.py.
+
+For every course, CoursePagesClient.get_course_data is timed with the pages read from the corpus, which
+includes parsing and only reads the English page when needed. For every page, extract_div_content of the
+sections and extract_course_name are timed. Times are the best of --repeat runs, and allocations are the
+peak memory allocated by a single run. The names extracted are compared with names.json of the corpus.
+
+Run with: python -m benchmarks.extraction --parser html.parser
+"""
+
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+
+from clients.client import FALLBACK_HTML_PARSER, HTML_PARSERS, Client
+from clients.corpus import CORPUS_DIR, CorpusCoursePagesClient, read_corpus
+
+SECTION_IDS = [
+    "course-content-toggler",
+    "learning-method-toggler",
+    "learning-goal-toggler",
+]
+
+
+def best_time(function, repeat: int):
+    times = []
+    # The client prints pages without course info
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_allocated(function):
+    """
+    Peak memory allocated by a single call, in KB.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def benchmark_course_data(client: CorpusCoursePagesClient, codes, repeat: int):
+    print(f"{'course':>10} {'pages':>6} {'get_course_data':>16} {'peak':>9}")
+    total_time = 0
+    total_pages = 0
+    for code in codes:
+        client.pages_read = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            client.get_course_data(code)
+        pages_read = client.pages_read
+
+        elapsed = best_time(lambda: client.get_course_data(code), repeat)
+        peak = peak_allocated(lambda: client.get_course_data(code))
+        total_time += elapsed
+        total_pages += pages_read
+        print(f"{code:>10} {pages_read:>6} {elapsed * 1000:>14.2f}ms {peak:>7.0f}KB")
+    return total_pages, total_time
+
+
+def benchmark_page_functions(
+    client: CorpusCoursePagesClient, pages, names, repeat: int
+):
+    print(
+        f"{'page':>14} {'size':>7} {'extract_div_content':>20} {'peak':>7} "
+        f"{'extract_course_name':>20} {'peak':>7} {'name':>5}"
+    )
+    div_time = 0
+    name_time = 0
+    correct_names = 0
+    for code, language in sorted(pages):
+        page = pages[(code, language)]
+        soup = client.init_course_soup(client.normalize(page))
+
+        def extract_divs():
+            return [client.extract_div_content(soup, div_id) for div_id in SECTION_IDS]
+
+        def extract_name():
+            return client.extract_course_name(soup)
+
+        elapsed_divs = best_time(extract_divs, repeat)
+        elapsed_name = best_time(extract_name, repeat)
+        div_time += elapsed_divs
+        name_time += elapsed_name
+
+        expected_name = names.get(code, {}).get(language)
+        name_status = "-"
+        if expected_name is not None:
+            is_correct = extract_name() == expected_name
+            correct_names += is_correct
+            name_status = "ok" if is_correct else "wrong"
+        print(
+            f"{code + '.' + language:>14} {len(page) / 1024:>5.0f}KB "
+            f"{elapsed_divs * 1_000_000:>18.0f}µs {peak_allocated(extract_divs):>5.0f}KB "
+            f"{elapsed_name * 1_000_000:>18.0f}µs {peak_allocated(extract_name):>5.0f}KB "
+            f"{name_status:>5}"
+        )
+    return div_time, name_time, correct_names
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus-dir", default=CORPUS_DIR)
+    parser.add_argument("--parser", choices=HTML_PARSERS, default=FALLBACK_HTML_PARSER)
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Runs of each measurement"
+    )
+    arguments = parser.parse_args()
+
+    Client.use_parser(arguments.parser)
+    pages, names = read_corpus(arguments.corpus_dir)
+    client = CorpusCoursePagesClient(pages)
+    codes = sorted({code for code, _ in pages})
+    print(f"{len(codes)} courses, {len(pages)} pages, parsed with {client.html_parser}")
+    print()
+
+    data_pages, data_time = benchmark_course_data(client, codes, arguments.repeat)
+    print()
+    div_time, name_time, correct_names = benchmark_page_functions(
+        client, pages, names, arguments.repeat
+    )
+    name_count = sum(len(page_names) for page_names in names.values())
+
+    print()
+    print(f"get_course_data: {data_pages / data_time:.0f} pages/s")
+    print(f"extract_div_content: {len(pages) / div_time:.0f} pages/s")
+    print(
+        f"extract_course_name: {len(pages) / name_time:.0f} pages/s, "
+        f"{correct_names}/{name_count} names correct"
+    )
+
+
+if __name__ == "__main__":
+    main()
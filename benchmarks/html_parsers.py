@@ -0,0 +1,107 @@
+"""
+Compares the HTML parsers Client.init_soup can use, by parsing course pages and extracting their course data
+like CoursePagesClient.get_course_data does, with the whole page parsed and with only the regions of the page
+course data is extracted from (CoursePagesClient.init_course_soup). Also checks that every parser extracts the
+same course data as html5lib.
+
+The pages are read from a directory of saved pairs of Norwegian and English pages, named <code>.no.html and
+<code>.eng.html, or generated with the local stand-in for the course pages.
+
+Run with: python -m benchmarks.html_parsers --pages-dir clients/course_page_corpus
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from bs4.builder import builder_registry
+
+from benchmarks.standin_server import StandInDataset
+from clients.client import FALLBACK_HTML_PARSER, HTML_PARSERS
+from clients.corpus import read_pages
+from clients.course_pages import CoursePagesClient
+
+
+def generate_pages(count: int):
+    dataset = StandInDataset(count, current_page_rate=1.0)
+    return [
+        (
+            code,
+            dataset.get_course_page(code, language="no"),
+            dataset.get_course_page(code, language="eng"),
+        )
+        for code in dataset.names
+    ]
+
+
+def extract(client: CoursePagesClient, pages, partial: bool = False):
+    init_soup = client.init_course_soup if partial else client.init_soup
+    return [
+        client.extract_course_data(
+            code,
+            init_soup(client.normalize(page_no)),
+            init_soup(client.normalize(page_eng)),
+        )
+        for code, page_no, page_eng in pages
+    ]
+
+
+def measure_page_memory(client: CoursePagesClient, page: str, partial: bool):
+    """
+    Peak memory of parsing a single page into a tree.
+    """
+    init_soup = client.init_course_soup if partial else client.init_soup
+    tracemalloc.start()
+    soup = init_soup(client.normalize(page))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del soup
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages-dir", help="Directory of saved course pages")
+    parser.add_argument(
+        "--pages", type=int, default=200, help="Number of pages to generate"
+    )
+    arguments = parser.parse_args()
+
+    if arguments.pages_dir:
+        pages = read_pages(arguments.pages_dir)
+    else:
+        pages = generate_pages(arguments.pages)
+    print(f"{len(pages)} courses, {len(pages) * 2} pages")
+
+    client = CoursePagesClient()
+    client.html_parser = FALLBACK_HTML_PARSER
+    expected = extract(client, pages)
+
+    print(
+        f"{'parser':>12} {'regions':>8} {'total':>8} {'per page':>10} {'pages/s':>8} "
+        f"{'peak/page':>10} {'parity':>7}"
+    )
+    for html_parser in HTML_PARSERS:
+        if builder_registry.lookup(html_parser) is None:
+            print(f"{html_parser:>12} not installed")
+            continue
+        client.html_parser = html_parser
+        # html5lib always parses the whole page
+        for partial in (
+            (False, True) if html_parser != FALLBACK_HTML_PARSER else (False,)
+        ):
+            start = time.perf_counter()
+            results = extract(client, pages, partial)
+            elapsed = time.perf_counter() - start
+            page_count = len(pages) * 2
+            peak = measure_page_memory(client, pages[0][1], partial)
+            identical = sum(result == data for result, data in zip(results, expected))
+            print(
+                f"{html_parser:>12} {'yes' if partial else 'no':>8} {elapsed:>7.2f}s "
+                f"{elapsed / page_count * 1000:>8.2f}ms {page_count / elapsed:>8.0f} "
+                f"{peak:>8.0f}KB {identical:>3}/{len(pages)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+A local stand-in for the DBH API and the NTNU course pages, so syncs can be run and measured without
+dbh.hkdir.no and ntnu.no.
+
+It serves a synthetic dataset: `hentJSONTabellData` responses for the course (208) and grade (308) tables,
+filtered and sorted like DBH does for the queries of NSDClient, and a Norwegian and English course page for
+every course. Every response can be delayed and a share of them can fail with a 500.
+
+Run with: python -m benchmarks.standin_server --port 8000
+and sync against it with: python scripts/grades_sync.py --dbh-url http://localhost:8000
+--course-pages-url http://localhost:8000
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from fnmatch import fnmatchcase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from operator import itemgetter
+
+COURSE_TABLE_ID = 208
+GRADE_TABLE_ID = 308
+
+NO_CONTENT_TITLE = "Det finnes ingen informasjon for dette studieåret"
+
+COURSE_PAGE_PATHS = {
+    "studier/emner": "no",
+    "studies/courses": "eng",
+}
+
+
+class StandInDataset:
+    """
+    Synthetic DBH tables and course pages for `course_count` courses.
+
+    A share of the courses have a second version of their code, taught in the later years. Of the courses,
+    `current_page_rate` have a current course page, and `year_page_rate` of the rest only have a page for the
+    last year they were taught.
+
+    Like on ntnu.no, most of a course page is navigation and other markup around the course information,
+    `navigation_links` links of it.
+    """
+
+    department_codes = ["194", "66", "67", "68"]
+    study_levels = {"LN": "Grunnleggende emner, nivå I", "HN": "Høyere grads nivå"}
+
+    def __init__(
+        self,
+        course_count: int = 200,
+        first_year: int = 2015,
+        last_year: int = 2024,
+        current_page_rate: float = 0.8,
+        year_page_rate: float = 0.5,
+        page_paragraphs: int = 20,
+        navigation_links: int = 300,
+        seed: int = 0,
+    ):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.page_paragraphs = page_paragraphs
+        self.navigation = "".join(
+            f'<li class="menu-item"><a href="/studier/lenke-{index}">Lenke {index}</a></li>'
+            for index in range(navigation_links)
+        )
+        self.courses = []
+        self.grades = []
+        self.page_years = {}
+        self.names = {}
+        self.study_levels_by_code = {}
+
+        random_ = random.Random(seed)
+        for number in range(course_count):
+            code = f"TST{number:04d}"
+            name = f"Testemne {number}"
+            level = random_.choice(list(self.study_levels))
+            department_code = random_.choice(self.department_codes)
+            start_year = random_.randint(first_year, last_year)
+            end_year = random_.randint(start_year, last_year)
+            discontinued = end_year < last_year
+            second_version_year = (
+                random_.randint(start_year, end_year) if number % 10 == 0 else None
+            )
+
+            for year in range(start_year, end_year + 1):
+                version = (
+                    2 if second_version_year and year >= second_version_year else 1
+                )
+                for semester in random_.choice([["1"], ["3"], ["1", "3"]]):
+                    status = "3" if discontinued and year == end_year else "1"
+                    self.courses.append(
+                        {
+                            "Institusjonskode": "1150",
+                            "Emnekode": f"{code}-{version}",
+                            "Emnenavn": name,
+                            "Årstall": str(year),
+                            "Semester": semester,
+                            "Status": status,
+                            "Avdelingskode": department_code,
+                            "Studiepoeng": "7.5",
+                            "Nivåkode": level,
+                        }
+                    )
+                    for letter in "ABCDEF":
+                        self.grades.append(
+                            {
+                                "Institusjonskode": "1150",
+                                "Emnekode": f"{code}-{version}",
+                                "Karakter": letter,
+                                "Årstall": str(year),
+                                "Semester": semester,
+                                "Avdelingskode": department_code,
+                                "Antall kandidater totalt": str(random_.randint(0, 40)),
+                            }
+                        )
+
+            self.names[code] = name
+            self.study_levels_by_code[code] = level
+            if random_.random() < current_page_rate:
+                self.page_years[code] = None
+            elif random_.random() < year_page_rate:
+                self.page_years[code] = end_year
+
+    def get_table(self, table_id: int):
+        if table_id == COURSE_TABLE_ID:
+            return self.courses
+        if table_id == GRADE_TABLE_ID:
+            return self.grades
+        raise ValueError(f"Unknown table {table_id}")
+
+    @staticmethod
+    def matches(row: dict, table_filter: dict):
+        selection = table_filter["selection"]
+        values = [str(value) for value in selection["values"]]
+        value = row.get(table_filter["variabel"])
+        filter_type = selection["filter"]
+        if filter_type == "item":
+            return value in values
+        if filter_type == "like":
+            return value is not None and any(
+                fnmatchcase(value, pattern.replace("%", "*")) for pattern in values
+            )
+        if filter_type == "all":
+            return value not in selection.get("exclude", [])
+        raise ValueError(f"Unsupported filter {filter_type}")
+
+    def query(self, query: dict):
+        """
+        The rows of a `hentJSONTabellData` query, filtered, sorted and limited like DBH does.
+        """
+        rows = [
+            row
+            for row in self.get_table(query["tabell_id"])
+            if all(self.matches(row, table_filter) for table_filter in query["filter"])
+        ]
+        if query.get("sortBy"):
+            rows.sort(key=itemgetter(*query["sortBy"]))
+        if query.get("begrensning"):
+            rows = rows[: int(query["begrensning"])]
+        return rows
+
+    def has_page(self, code: str, year: int = None):
+        if code not in self.page_years:
+            return False
+        return self.page_years[code] == year
+
+    def get_course_page(self, code: str, year: int = None, language: str = "no"):
+        if not self.has_page(code, year):
+            return (
+                f"<html><head><title>{code} - NTNU</title></head><body>"
+                f"<nav><ul>{self.navigation}</ul></nav>"
+                f'<div id="course-details"><h1>{NO_CONTENT_TITLE}</h1></div>'
+                "</body></html>"
+            )
+
+        name = self.names[code]
+        if language == "eng":
+            name = f"Test course {code[3:].lstrip('0') or '0'}"
+        paragraphs = "".join(
+            f"<p>Avsnitt {index} om {name}, med tekst som gjør siden omtrent like stor som en ekte emneside.</p>"
+            for index in range(self.page_paragraphs)
+        )
+        facts = {
+            "Studiepoeng": "7,5",
+            "Nivå": self.study_levels[self.study_levels_by_code[code]],
+            "Undervisningsstart": "Høst",
+            "Undervisningsspråk": "Norsk",
+            "Sted": "Sted\nTrondheim",
+        }
+        fact_elements = "".join(
+            '<div class="course-fact">'
+            f'<div class="course-fact-label">{label}</div>'
+            f'<div class="course-fact-value">{value}</div>'
+            "</div>"
+            for label, value in facts.items()
+        )
+        return (
+            f"<html><head><title>{code} - {name} - NTNU</title></head><body>"
+            f"<nav><ul>{self.navigation}</ul></nav>"
+            f'<div id="course-details"><h1>{code} - {name}</h1>{fact_elements}</div>'
+            f'<div id="course-content-toggler">{paragraphs}</div>'
+            f'<div id="learning-method-toggler"><p>Forelesninger og øvinger.</p></div>'
+            f'<div id="learning-goal-toggler"><ul><li>Kunnskap</li><li>Ferdigheter</li></ul></div>'
+            '<div id="omEksamen"><h3 class="grade-rule-heading">Karakter: Bokstavkarakterer</h3>'
+            "<a>Inspera Assessment</a>"
+            '<dl><dt><span class="exam-term">Høst</span><span class="exam-system">INSPERA</span></dt>'
+            '<dt><span class="exam-term">Vår</span><span class="exam-system">PAPIR</span></dt></dl></div>'
+            "</body></html>"
+        )
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    # Keep connections alive like the real hosts, so sessions can reuse them
+    protocol_version = "HTTP/1.1"
+    course_page_pattern = re.compile(
+        r"^/(?P<path>studier/emner|studies/courses)/(?P<code>[^/]+)(?:/(?P<year>\d{4}))?/?$"
+    )
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, kind: str):
+        self.server.count(kind)
+        if self.server.should_fail():
+            self.server.count("errors")
+            self.send_body(500, b"Internal Server Error", "text/plain")
+            return False
+        return True
+
+    def do_POST(self):
+        if self.path != "/api/Tabeller/hentJSONTabellData":
+            self.send_body(404, b"Not Found", "text/plain")
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.handle_request("dbh"):
+            return
+
+        rows = self.server.dataset.query(json.loads(body))
+        content = json.dumps(rows, ensure_ascii=False).encode("utf-8")
+        self.send_body(200, content, "application/json; charset=utf-8")
+
+    def do_GET(self):
+        match = self.course_page_pattern.match(self.path)
+        if not match:
+            self.send_body(404, b"Not Found", "text/plain")
+            return
+        if not self.handle_request("course_pages"):
+            return
+
+        year = int(match["year"]) if match["year"] else None
+        page = self.server.dataset.get_course_page(
+            match["code"], year, COURSE_PAGE_PATHS[match["path"]]
+        )
+        self.send_body(200, page.encode("utf-8"), "text/html; charset=utf-8")
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Serves a StandInDataset, delaying every response by `latency` seconds and failing `error_rate` of them.
+
+    The number of requests of each kind and of failed requests are counted in `requests`.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        dataset: StandInDataset,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        super().__init__((host, port), StandInRequestHandler)
+        self.dataset = dataset
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        # Clients closing kept-alive connections are expected, e.g. when a session is dropped
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self, kind: str):
+        with self.lock:
+            self.requests[kind] += 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests = Counter()
+
+    def should_fail(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to delay every response"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of responses which fail with a 500",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    dataset = StandInDataset(arguments.courses, seed=arguments.seed)
+    server = StandInServer(
+        dataset,
+        arguments.host,
+        arguments.port,
+        latency=arguments.latency,
+        error_rate=arguments.error_rate,
+        seed=arguments.seed,
+    )
+    print(
+        f"Serving {len(dataset.courses)} course rows and {len(dataset.grades)} grade rows on {server.url}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Runs full syncs against the local stand-in for DBH and the course pages (benchmarks/standin_server.py),
+in a temporary database, and reports wall time, requests made and database queries per course.
+
+Later runs sync the same data again, like a nightly sync where nothing changed, or with --full a sync of
+every course.
+
+With --archive, the fetched pages are archived and the courses are reparsed from the archive after the
+syncs, to compare with the time of syncing them.
+
+Run with: python -m benchmarks.sync --courses 200 --latency 0.02
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gradestats.settings.dev")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+
+from benchmarks.standin_server import StandInDataset, StandInServer  # noqa: E402
+from clients.client import FALLBACK_HTML_PARSER, HTML_PARSERS, Client  # noqa: E402
+from clients.course_pages import CoursePagesClient  # noqa: E402
+from clients.metrics import metrics  # noqa: E402
+from clients.nsd import NSDClient, NSDCourseClient, NSDGradeClient  # noqa: E402
+from grades.models import Department, Faculty  # noqa: E402
+from services.reparse_service import ReparseService  # noqa: E402
+from services.sync_service import SyncService  # noqa: E402
+
+
+class QueryCounter:
+    """
+    Counts the queries of every database connection, also those opened by the fetcher threads of the sync.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self.install)
+        self.install(connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+        connection.execute_wrappers.remove(self)
+
+
+def use_standin_server(server: StandInServer):
+    NSDClient.base_url = server.url
+    CoursePagesClient.base_url_no = f"{server.url}/studier/emner"
+    CoursePagesClient.base_url_eng = f"{server.url}/studies/courses"
+
+
+def create_faculties(dataset: StandInDataset):
+    for index, department_code in enumerate(dataset.department_codes):
+        Faculty.objects.create(
+            acronym=f"F{index}",
+            norwegian_name=f"Fakultet {index}",
+            organization_unit_id=index,
+            nsd_code=f"1150{department_code}",
+            faculty_id=index,
+        )
+
+
+def run_sync(arguments, server: StandInServer):
+    metrics.reset()
+    server.reset_counts()
+
+    years = None
+    if arguments.chunked:
+        years = range(server.dataset.first_year, datetime.now().year + 1)
+
+    with QueryCounter() as queries:
+        start = time.perf_counter()
+        grades = list(NSDGradeClient().get_all_grades(stream=True, years=years))
+        courses = list(NSDCourseClient().get_all_courses(stream=True, years=years))
+        sync_service = SyncService(
+            workers=arguments.workers,
+            per_host_limit=arguments.per_host_limit,
+            rate=arguments.rate,
+            batch_size=arguments.batch_size,
+            full=arguments.full,
+            digital_exams=arguments.digital_exams,
+        )
+        report = sync_service.sync(
+            grades, courses, Faculty.objects.all(), Department.objects.all()
+        )
+        wall_time = time.perf_counter() - start
+
+    return report, wall_time, queries.count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Seconds to delay every response"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of responses which fail with a 500",
+    )
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-host-limit", type=int, default=4)
+    parser.add_argument("--rate", type=float)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--chunked", action="store_true")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Sync every course in later runs too, instead of only changed courses",
+    )
+    parser.add_argument("--digital-exams", action="store_true")
+    parser.add_argument("--archive", action="store_true")
+    parser.add_argument("--processes", type=int, help="Processes reparsing pages")
+    parser.add_argument("--parser", choices=HTML_PARSERS, default=FALLBACK_HTML_PARSER)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    dataset = StandInDataset(arguments.courses, seed=arguments.seed)
+    server = StandInServer(
+        dataset,
+        latency=arguments.latency,
+        error_rate=arguments.error_rate,
+        seed=arguments.seed,
+    ).start()
+    use_standin_server(server)
+    Client.use_parser(arguments.parser)
+
+    # A file database, since the sync writes from several threads
+    directory = tempfile.mkdtemp()
+    if arguments.archive:
+        CoursePagesClient.use_archive(os.path.join(directory, "archive"))
+    connection.settings_dict["TEST"]["NAME"] = os.path.join(directory, "sync.sqlite3")
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        create_faculties(dataset)
+        print(
+            f"{'run':>4} {'wall':>8} {'courses':>8} {'requests':>9} {'errors':>7} "
+            f"{'conns':>6} {'queries':>8} {'req/course':>11} {'queries/course':>15}"
+        )
+        for run in range(arguments.runs):
+            report, wall_time, query_count = run_sync(arguments, server)
+            courses = max(
+                report.created
+                + report.updated
+                + report.unchanged
+                + report.skipped
+                + report.failed,
+                1,
+            )
+            requests = server.requests["dbh"] + server.requests["course_pages"]
+            print(
+                f"{run:>4} {wall_time:>7.2f}s {courses:>8} {requests:>9} "
+                f"{server.requests['errors']:>7} "
+                f"{metrics.counters['http_connections_opened']:>6} {query_count:>8} "
+                f"{requests / courses:>11.2f} {query_count / courses:>15.2f}"
+            )
+            print(f"     {report}")
+
+        if arguments.archive:
+            start = time.perf_counter()
+            report = ReparseService(
+                CoursePagesClient.archive.directory, processes=arguments.processes
+            ).run()
+            print(f"Reparse {time.perf_counter() - start:.2f}s: {report}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
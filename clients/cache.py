@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .files import atomic_write
+from .metrics import metrics
+
+
+class CacheMiss(requests.exceptions.ConnectionError):
+    """
+    A request was not found in a replay only cache.
+    """
+
+
+class CachedResponse:
+    def __init__(self, meta: dict, content: bytes):
+        self.meta = meta
+        self.content = content
+
+    def is_fresh(self, ttl: timedelta):
+        return time.time() - self.meta["stored_at"] < ttl.total_seconds()
+
+    def get_conditional_headers(self):
+        headers = {}
+        cached_headers = CaseInsensitiveDict(self.meta["headers"])
+        etag = cached_headers.get("ETag")
+        last_modified = cached_headers.get("Last-Modified")
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def to_response(self):
+        response = requests.Response()
+        response.status_code = self.meta["status_code"]
+        response.reason = self.meta["reason"]
+        response.url = self.meta["url"]
+        response.encoding = self.meta["encoding"]
+        response.headers = CaseInsensitiveDict(self.meta["headers"])
+        response._content = self.content
+        response._content_consumed = True
+        return response
+
+
+class ResponseCache:
+    """
+    On-disk cache of HTTP responses, addressed by a hash of the method, URL and body of the request.
+
+    Stale responses are revalidated with If-None-Match/If-Modified-Since when the server sent an ETag or
+    Last-Modified header. In replay only mode nothing is requested, and requests which are not cached fail
+    with CacheMiss.
+    """
+
+    def __init__(self, directory: str, replay_only: bool = False):
+        self.directory = directory
+        self.replay_only = replay_only
+
+    @staticmethod
+    def get_key(method: str, url: str, body: bytes = b""):
+        key = hashlib.sha256()
+        for part in [method.upper().encode("utf-8"), url.encode("utf-8"), body]:
+            key.update(part)
+            key.update(b"\0")
+        return key.hexdigest()
+
+    @staticmethod
+    def get_request_body(json_data=None, data=None):
+        if json_data is not None:
+            return json.dumps(json_data, sort_keys=True).encode("utf-8")
+        if isinstance(data, str):
+            return data.encode("utf-8")
+        if isinstance(data, bytes):
+            return data
+        if data:
+            return json.dumps(data, sort_keys=True).encode("utf-8")
+        return b""
+
+    def get_path(self, key: str):
+        return os.path.join(self.directory, key[:2], key)
+
+    def load(self, key: str):
+        path = self.get_path(key)
+        try:
+            with open(f"{path}.json", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            with open(f"{path}.body", "rb") as content_file:
+                content = content_file.read()
+        except (OSError, ValueError):
+            return None
+        return CachedResponse(meta, content)
+
+    def store(self, key: str, response: requests.Response):
+        cached = CachedResponse(
+            {
+                "status_code": response.status_code,
+                "reason": response.reason,
+                "url": response.url,
+                "encoding": response.encoding,
+                "headers": dict(response.headers),
+                "stored_at": time.time(),
+            },
+            response.content,
+        )
+        self.save(key, cached)
+
+    def save(self, key: str, cached: CachedResponse):
+        path = self.get_path(key)
+        with atomic_write(f"{path}.body") as content_file:
+            content_file.write(cached.content)
+        with atomic_write(f"{path}.json") as meta_file:
+            meta_file.write(json.dumps(cached.meta, ensure_ascii=False).encode("utf-8"))
+
+    def request(
+        self,
+        session: requests.Session,
+        method: str,
+        url: str,
+        ttl: timedelta,
+        limit,
+        **kwargs,
+    ):
+        """
+        Get the response from the cache, or from the session when it is missing or stale.
+        `limit` is a context manager for the host of the URL, held while requesting.
+        """
+        body = self.get_request_body(kwargs.get("json"), kwargs.get("data"))
+        key = self.get_key(method, url, body)
+        cached = self.load(key)
+
+        if cached and (self.replay_only or cached.is_fresh(ttl)):
+            metrics.increment("cache_hits")
+            return cached.to_response()
+        if self.replay_only:
+            raise CacheMiss(f"{method} {url} is not cached")
+        metrics.increment("cache_misses")
+
+        # The whole response is read to be stored anyway
+        kwargs.pop("stream", None)
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached:
+            headers.update(cached.get_conditional_headers())
+
+        with limit(url):
+            response = session.request(method, url, headers=headers, **kwargs)
+
+        if cached and response.status_code == 304:
+            metrics.increment("cache_revalidated")
+            cached.meta["stored_at"] = time.time()
+            self.save(key, cached)
+            return cached.to_response()
+
+        if response.status_code == 200:
+            self.store(key, response)
+        return response
@@ -1,31 +1,82 @@
+from contextlib import nullcontext
+from datetime import timedelta
+
 from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from .cache import ResponseCache
+from .metrics import metrics
+from .transport import Transport, transport
+
+# BeautifulSoup tree builders pages can be parsed with, from the fastest. lxml is an optional dependency.
+HTML_PARSERS = ("lxml", "html.parser", "html5lib")
+FALLBACK_HTML_PARSER = "html5lib"
 
 
 class Client:
     session = None
+    # Optional HostThrottle shared between the threads using this client
+    throttle = None
+    # Response cache shared by every client, see Client.use_cache
+    cache: ResponseCache = None
+    # How long cached responses are used before revalidating them. Responses are not cached when None.
+    cache_ttl: timedelta = None
+    # Tree builder used by init_soup for every client, see Client.use_parser
+    html_parser = FALLBACK_HTML_PARSER
+    # Connection pools, retries and timeouts shared by every client, see Client.use_transport
+    transport: Transport = transport
 
     def __init__(self):
         super().__init__()
-        self.session = requests.session()
+        self.session = self.transport.create_session()
+
+    @classmethod
+    def use_cache(cls, directory: str, replay_only: bool = False):
+        cls.cache = ResponseCache(directory, replay_only=replay_only)
+
+    @classmethod
+    def use_transport(cls, **options):
+        """
+        Configure the transport of every client, also of clients created before, see Transport.configure.
+        """
+        cls.transport.configure(**options)
+
+    @classmethod
+    def use_parser(cls, parser: str):
+        """
+        Parse pages with `parser` instead of html5lib, or with html5lib when the parser is not installed.
+        """
+        if parser not in HTML_PARSERS:
+            raise ValueError(
+                f"Unknown HTML parser {parser}, expected one of {', '.join(HTML_PARSERS)}"
+            )
+        if builder_registry.lookup(parser) is None:
+            print(
+                f"HTML parser {parser} is not installed, using {FALLBACK_HTML_PARSER}"
+            )
+            parser = FALLBACK_HTML_PARSER
+        cls.html_parser = parser
+        return parser
 
     def init_soup(self, page_text: str):
-        return BeautifulSoup(page_text, "html5lib")
+        with metrics.timer("html_parse"):
+            return BeautifulSoup(page_text, self.html_parser)
 
-    def requests_retry_session(
-        retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 504), session=None
+    def limit(self, url: str):
+        if self.throttle is None:
+            return nullcontext()
+        return self.throttle.limit(url)
+
+    def request(
+        self, method: str, url: str, session: requests.Session = None, **kwargs
     ):
-        session = session or requests.Session()
-        retry = Retry(
-            total=retries,
-            read=retries,
-            connect=retries,
-            backoff_factor=backoff_factor,
-            status_forcelist=status_forcelist,
-        )
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        return session
+        session = session or self.session
+        with metrics.timer("http_request"):
+            if self.cache is None or self.cache_ttl is None:
+                with self.limit(url):
+                    return session.request(method, url, **kwargs)
+
+            return self.cache.request(
+                session, method, url, self.cache_ttl, self.limit, **kwargs
+            )
@@ -0,0 +1,70 @@
+"""
+The corpus of course pages in course_page_corpus, used by the tests and benchmarks/extraction.py.
+
+It has the Norwegian and English page of courses covering the cases the extraction has to handle: a regular
+course (TDT4100), long names with hyphens (TKT4116), a course taught in English whose Norwegian page refers to
+the English one (TTK4250), a doctoral course with pass/fail grading and a short English page (DIK8100), a long
+description (TMA4115), a course no longer taught (TDT4105) and a year without course information (EXPH0300).
+Around the course information, the pages have the navigation, header and footer of ntnu.no. names.json has the
+names extract_course_name should find on each page.
+"""
+
+import json
+import os
+
+from .course_pages import CoursePagesClient
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "course_page_corpus")
+
+
+class CorpusCoursePagesClient(CoursePagesClient):
+    """
+    Reads course pages from the corpus instead of requesting them, and counts the pages read.
+    """
+
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = pages
+        self.pages_read = 0
+
+    def get_page(
+        self,
+        code,
+        year: int = None,
+        language: str = "no",
+        raise_for_status: bool = False,
+    ):
+        self.pages_read += 1
+        return self.normalize(self.pages[(code, language)])
+
+
+def read_pages(directory: str):
+    """
+    Pairs of Norwegian and English pages from a directory of pages named <code>.no.html and <code>.eng.html.
+    """
+    pages = []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".no.html"):
+            continue
+        code = file_name.removesuffix(".no.html")
+        with open(os.path.join(directory, file_name), encoding="utf-8") as page_file:
+            page_no = page_file.read()
+        with open(
+            os.path.join(directory, f"{code}.eng.html"), encoding="utf-8"
+        ) as page_file:
+            page_eng = page_file.read()
+        pages.append((code, page_no, page_eng))
+    return pages
+
+
+def read_corpus(directory: str = CORPUS_DIR):
+    """
+    The pages of the corpus by code and language, and the names of the pages by code and language.
+    """
+    pages = {}
+    for code, page_no, page_eng in read_pages(directory):
+        pages[(code, "no")] = page_no
+        pages[(code, "eng")] = page_eng
+    with open(os.path.join(directory, "names.json"), encoding="utf-8") as names_file:
+        names = json.load(names_file)
+    return pages, names
@@ -1,10 +1,67 @@
+from datetime import timedelta
 from typing import Optional
 
 import bs4
-from .client import Client
+import requests
+from bs4.filter import ElementFilter
+
+from .client import FALLBACK_HTML_PARSER, Client
+from .metrics import metrics
+from .page_archive import PageArchive
+
+
+class PageNotArchived(Exception):
+    """
+    A course page was not found in the archive an ArchivedCoursePagesClient reads from.
+    """
+
+
+class CoursePageRegions(ElementFilter):
+    """
+    The regions of a course page which course data is extracted from: the title, the elements with one of
+    `ids` and the course facts. Used as `parse_only`, the rest of the page is never built into the tree.
+    """
+
+    ids = {
+        "course-details",
+        "omEksamen",
+        "course-content-toggler",
+        "learning-method-toggler",
+        "learning-goal-toggler",
+    }
+    fact_class = "course-fact"
+
+    def is_region(self, name: str, attrs):
+        if name == "title":
+            return True
+        if not attrs:
+            return False
+        if attrs.get("id") in self.ids:
+            return True
+        classes = attrs.get("class") or ""
+        if isinstance(classes, str):
+            classes = classes.split()
+        return self.fact_class in classes
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.is_region(name, attrs)
+
+    def allow_string_creation(self, string):
+        # Text outside of the regions
+        return False
+
+    def match(self, element, _known_rules: bool = False):
+        return isinstance(element, bs4.Tag) and self.is_region(
+            element.name, element.attrs
+        )
 
 
 class CoursePagesClient(Client):
+    base_url_no = "https://www.ntnu.no/studier/emner"
+    base_url_eng = "https://www.ntnu.edu/studies/courses"
+    no_content_title = "Det finnes ingen informasjon for dette studieåret"
+    no_longer_taught_text = "Det tilbys ikke lenger undervisning i emnet."
+    cache_ttl = timedelta(days=1)
     USE_ENGLISH_VERSION_FILTERS = [
         "se engelsk versjon",
         "see english version",
@@ -16,9 +73,25 @@ class CoursePagesClient(Client):
         "see english text",
         "se emnets engelske nettside",
     ]
+    # Sections of the course data which are read from the English page when the Norwegian one refers to it
+    ENGLISH_SECTION_IDS = {
+        "content": "course-content-toggler",
+        "learning_form": "learning-method-toggler",
+        "learning_goal": "learning-goal-toggler",
+    }
+
+    course_page_regions = CoursePageRegions()
+    # Archive every fetched page is stored in, see CoursePagesClient.use_archive
+    archive: PageArchive = None
+
+    @classmethod
+    def use_archive(cls, directory: str):
+        cls.archive = PageArchive(directory)
 
     def extract_div_content(self, soup, div_id):
-        div = soup.find("div", {"id": div_id})
+        return self.get_div_content(soup.find("div", {"id": div_id}))
+
+    def get_div_content(self, div):
         if not div:
             return ""
 
@@ -66,7 +139,9 @@ class CoursePagesClient(Client):
         return name
 
     def extract_has_digital_exam(self, soup):
-        om_eksamen: Optional[bs4.element.Tag] = soup.find(attrs={"id": "omEksamen"})
+        return self.has_digital_exam(soup.find(attrs={"id": "omEksamen"}))
+
+    def has_digital_exam(self, om_eksamen: Optional[bs4.element.Tag]):
         if om_eksamen is None:
             return False
 
@@ -76,6 +151,32 @@ class CoursePagesClient(Client):
 
         return False
 
+    def extract_exam_terms(self, om_eksamen: Optional[bs4.element.Tag]):
+        """
+        Whether the exam of each term in the exam table of a course page was digital, by the term as it is
+        named on the page, e.g. Vår.
+        """
+        terms = {}
+        dl = om_eksamen.find("dl") if om_eksamen is not None else None
+        if dl is None:
+            return terms
+
+        for dt in dl.find_all("dt"):
+            term = dt.find(class_="exam-term")
+            if term is None:
+                continue
+            system = dt.find(class_="exam-system")
+            terms[term.get_text().strip()] = (
+                system is not None and system.get_text().strip() == "INSPERA"
+            )
+        return terms
+
+    def get_exam_terms(self, code, year: int):
+        # An error page has no exam table either, which would be taken as no digital exams
+        text = self.get_page(code, year, raise_for_status=True)
+        regions, _ = self.find_regions(self.init_course_soup(text))
+        return self.extract_exam_terms(regions.get("omEksamen"))
+
     @staticmethod
     def get_study_level_from_description(description: str):
         if description == "Doktorgrads nivå":
@@ -114,18 +215,46 @@ class CoursePagesClient(Client):
     def remove_whitespace(self, string: str):
         return " ".join(string.split())
 
-    def get_course_data(self, code, year: int = None):
+    def get_course_url(self, base_url: str, code: str, year: int = None):
         year_segment = ""
         if year:
             year_segment += f"/{str(year)}"
 
-        base_url_no = f"https://www.ntnu.no/studier/emner/{code}{year_segment}"
-        data_no = self.requests_retry_session(self.session).get(url=base_url_no)
-        text_no = self.normalize(data_no.text)
-        soup_no = self.init_soup(text_no)
+        return f"{base_url}/{code}{year_segment}"
+
+    def get_base_url(self, language: str):
+        return self.base_url_eng if language == "eng" else self.base_url_no
+
+    def get_course_page(self, url: str, raise_for_status: bool = False):
+        response = self.request("GET", url)
+        if raise_for_status and response.status_code != 200:
+            raise requests.HTTPError(
+                f"{response.status_code} response for {url}", response=response
+            )
+        return self.normalize(response.text)
+
+    def get_page(
+        self,
+        code,
+        year: int = None,
+        language: str = "no",
+        raise_for_status: bool = False,
+    ):
+        """
+        The Norwegian or English (eng) course page of a year, or the current page. Stored in the archive when
+        one is used. With `raise_for_status`, any other response than 200 raises HTTPError instead of
+        returning the error page.
+        """
+        text = self.get_course_page(
+            self.get_course_url(self.get_base_url(language), code, year),
+            raise_for_status=raise_for_status,
+        )
+        if self.archive is not None:
+            self.archive.store(code, year, language, text)
+        return text
 
-        no_content_title = "Det finnes ingen informasjon for dette studieåret"
-        course_detail_h1 = no_content_title
+    def has_course_info(self, soup_no, code, year: int = None):
+        course_detail_h1 = self.no_content_title
         try:
             course_detail_h1 = (
                 soup_no.find_all("div", {"id": "course-details"})[0]
@@ -135,34 +264,124 @@ class CoursePagesClient(Client):
         except IndexError:
             print("Something very wrong for course: " + code)
 
-        if course_detail_h1 == no_content_title:
+        if course_detail_h1 == self.no_content_title:
+            metrics.increment("course_page_misses")
             print(
                 f"No info found for course {code}"
                 + (f" for year {year}" if year else "")
             )
-            return None
+            return False
 
-        no_longer_taught_text = "Det tilbys ikke lenger undervisning i emnet."
         try:
             course_details = soup_no.find("div", {"id": "course-details"}).get_text(
                 strip=True
             )
-            if no_longer_taught_text in course_details:
+            if self.no_longer_taught_text in course_details:
                 year_info = f" in year {year}" if year else ""
                 print(f"Course {code} not taught{year_info}")
-                return None
+                metrics.increment("course_page_misses")
+                return False
         except Exception:
             pass
 
-        has_digital_exam = self.extract_has_digital_exam(soup_no)
+        return True
+
+    def init_course_soup(self, page_text: str):
+        """
+        Parse only the regions of a course page which course data is extracted from.
+        html5lib can't skip parts of a page, so with html5lib the whole page is parsed.
+        """
+        if self.html_parser == FALLBACK_HTML_PARSER:
+            return self.init_soup(page_text)
+        with metrics.timer("html_parse"):
+            return bs4.BeautifulSoup(
+                page_text, self.html_parser, parse_only=self.course_page_regions
+            )
+
+    def find_regions(self, soup):
+        """
+        Find the first element of each region id, and every course fact, in a single traversal of the page.
+        """
+        regions = {}
+        facts = []
+        for tag in soup.find_all(self.course_page_regions.match):
+            if tag.get("id") in self.course_page_regions.ids:
+                regions.setdefault(tag["id"], tag)
+            if self.course_page_regions.fact_class in tag.get("class", []):
+                facts.append(tag)
+        return regions, facts
+
+    def get_region_content(self, regions, div_id):
+        div = regions.get(div_id)
+        return self.get_div_content(div if div and div.name == "div" else None)
+
+    def get_course_data(self, code, year: int = None, english_name: str = None):
+        """
+        Course data from the Norwegian course page. The English page is only fetched when the English name
+        is not given, or a section of the Norwegian page refers to the English page.
+        """
+        text_no = self.get_page(code, year)
+        soup_no = self.init_course_soup(text_no)
+
+        if not self.has_course_info(soup_no, code, year):
+            return None
 
-        base_url_eng = f"https://www.ntnu.edu/studies/courses/{code}{year_segment}"
-        data_eng = self.requests_retry_session(self.session).get(url=base_url_eng)
-        text_eng = self.normalize(data_eng.text)
-        soup_eng = self.init_soup(text_eng)
+        data = self.extract_course_data(code, soup_no, english_name=english_name)
+        if not self.needs_english_page(data):
+            metrics.increment("english_pages_skipped")
+            return data
+
+        text_eng = self.get_page(code, year, "eng")
+        soup_eng = self.init_course_soup(text_eng)
+
+        return self.add_english_data(data, soup_eng)
+
+    def get_english_sections(self, data):
+        """
+        The sections of the course data which refer to the English page, and have to be read from it.
+        """
+        return [
+            field
+            for field in self.ENGLISH_SECTION_IDS
+            if self.use_english_version(data[field])
+        ]
+
+    def needs_english_page(self, data):
+        return not data["english_name"] or bool(self.get_english_sections(data))
+
+    def add_english_data(self, data, soup_eng):
+        with metrics.timer("course_page_extract"):
+            return self._add_english_data(data, soup_eng)
+
+    def _add_english_data(self, data, soup_eng):
+        regions_eng, _ = self.find_regions(soup_eng)
+        if not data["english_name"]:
+            data["english_name"] = self.extract_course_name(soup_eng)
+        for field in self.get_english_sections(data):
+            data[field] = self.get_region_content(
+                regions_eng, self.ENGLISH_SECTION_IDS[field]
+            )
+        return data
+
+    def extract_course_data(
+        self, code, soup_no, soup_eng=None, english_name: str = None
+    ):
+        """
+        Extract course data from the Norwegian page, and from the English page when it is given.
+        Without it, the English name is `english_name` and sections referring to the English page are kept.
+        """
+        with metrics.timer("course_page_extract"):
+            data = self._extract_course_data(code, soup_no, english_name or "")
+            if soup_eng is not None:
+                data = self._add_english_data(data, soup_eng)
+            return data
+
+    def _extract_course_data(self, code, soup_no, english_name: str):
+        regions_no, facts = self.find_regions(soup_no)
+
+        has_digital_exam = self.has_digital_exam(regions_no.get("omEksamen"))
 
         norwegian_name = self.extract_course_name(soup_no)
-        english_name = self.extract_course_name(soup_eng)
 
         last_year_taught = 0
         taught_from = 2008
@@ -176,7 +395,7 @@ class CoursePagesClient(Client):
         study_level = 0
         credit = 0
 
-        for fact in soup_no.select(".course-fact"):
+        for fact in facts:
             label = fact.select_one(".course-fact-label")
             value = fact.select_one(".course-fact-value")
 
@@ -209,7 +428,7 @@ class CoursePagesClient(Client):
                 if "engelsk" in value.lower():
                     taught_in_english = True
 
-        about_exam = soup_no.select_one("#omEksamen")
+        about_exam = regions_no.get("omEksamen")
         if about_exam:
             try:
                 grade_type_raw = about_exam.select_one(".grade-rule-heading")
@@ -219,19 +438,9 @@ class CoursePagesClient(Client):
             except:  # noqa: E722
                 "Cannot get grade type"
 
-        content = self.extract_div_content(soup_no, "course-content-toggler")
-        if self.use_english_version(content):
-            content = self.extract_div_content(soup_eng, "course-content-toggler")
-
-        learning_form = self.extract_div_content(soup_no, "learning-method-toggler")
-        if self.use_english_version(learning_form):
-            learning_form = self.extract_div_content(
-                soup_eng, "learning-method-toggler"
-            )
-
-        learning_goal = self.extract_div_content(soup_no, "learning-goal-toggler")
-        if self.use_english_version(learning_goal):
-            learning_goal = self.extract_div_content(soup_eng, "learning-goal-toggler")
+        content = self.get_region_content(regions_no, "course-content-toggler")
+        learning_form = self.get_region_content(regions_no, "learning-method-toggler")
+        learning_goal = self.get_region_content(regions_no, "learning-goal-toggler")
 
         course = {
             "norwegian_name": norwegian_name,
@@ -254,3 +463,59 @@ class CoursePagesClient(Client):
         }
 
         return course
+
+
+class ArchivedCoursePagesClient(CoursePagesClient):
+    """
+    Reads course pages from a PageArchive instead of requesting them, to extract course data again with the
+    current extraction rules, without network.
+    """
+
+    def __init__(self, archive: PageArchive):
+        super().__init__()
+        self.page_archive = archive
+
+    def get_page(
+        self,
+        code,
+        year: int = None,
+        language: str = "no",
+        raise_for_status: bool = False,
+    ):
+        text = self.page_archive.load(code, year, language)
+        if text is None:
+            raise PageNotArchived(
+                f"The {language} page of {code} {year} is not archived"
+            )
+        return text
+
+    def get_norwegian_course_data(self, code, year: int, english_name: str = None):
+        """
+        Course data from the Norwegian page alone. Sections referring to the English page are left out, so
+        the values the course already has for them are kept.
+        """
+        soup_no = self.init_course_soup(self.get_page(code, year))
+        if not self.has_course_info(soup_no, code, year):
+            return None
+
+        data = self.extract_course_data(code, soup_no, english_name=english_name)
+        for field in self.get_english_sections(data):
+            del data[field]
+        return data
+
+    def get_archived_course_data(self, code, english_name: str = None):
+        """
+        Course data from the newest archived page of a course with course info, like the sync picks it.
+
+        The English page is usually only archived when the sync needed it. Without it, `english_name` and the
+        current values of sections referring to the English page are kept, see get_norwegian_course_data.
+        """
+        for year in self.page_archive.get_years(code):
+            if self.page_archive.has_page(code, year, "eng"):
+                data = self.get_course_data(code, year)
+            else:
+                data = self.get_norwegian_course_data(code, year, english_name)
+            if data:
+                data["last_course_page_year"] = year or 0
+                return data
+        return None
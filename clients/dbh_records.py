@@ -0,0 +1,149 @@
+import re
+from collections.abc import Mapping
+from itertools import chain, groupby
+from json import JSONDecodeError, JSONDecoder
+from operator import itemgetter
+from typing import Iterable
+
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+class DBHRecord(Mapping):
+    """
+    A read-only row from a DBH table.
+
+    Rows with the same columns share a single key -> position lookup, and only store a tuple of values,
+    which takes a fraction of the memory of a dict per row.
+    """
+
+    __slots__ = ("_fields", "_values")
+
+    def __init__(self, fields: dict, values: tuple):
+        self._fields = fields
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._fields[key]]
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return f"DBHRecord({dict(self)!r})"
+
+
+class DBHRecordBuilder:
+    """
+    Builds records from decoded JSON objects, sharing columns and repeated string values between rows.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.strings = {}
+
+    def __call__(self, pairs):
+        keys = tuple(key for key, _ in pairs)
+        fields = self.fields.get(keys)
+        if fields is None:
+            fields = self.fields[keys] = {key: index for index, key in enumerate(keys)}
+
+        values = tuple(
+            self.strings.setdefault(value, value) if isinstance(value, str) else value
+            for _, value in pairs
+        )
+        return DBHRecord(fields, values)
+
+
+def iter_dbh_records(chunks: Iterable[str]):
+    """
+    Incrementally decode a JSON array of rows, yielding each row as a DBHRecord as soon as it is complete.
+    Anything other than an array yields no rows, like an unreadable response did with the regular client.
+    Raises JSONDecodeError when the array is truncated, so a partial table is never taken as complete.
+    """
+    decoder = JSONDecoder(object_pairs_hook=DBHRecordBuilder())
+    buffer = ""
+    position = 0
+    started = False
+
+    for chunk in chain(chunks, [None]):
+        if chunk is not None:
+            buffer = buffer[position:] + chunk
+            position = 0
+
+        while True:
+            position = _SEPARATORS.match(buffer, position).end()
+            if position == len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != "[":
+                    return
+                started = True
+                position += 1
+                continue
+
+            if buffer[position] == "]":
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except JSONDecodeError:
+                if chunk is None:
+                    raise
+                # The row continues in the next chunk
+                break
+
+            if end == len(buffer) and chunk is not None:
+                # A number at the end of the buffer could continue in the next chunk
+                break
+            position = end
+            yield record
+
+    if started:
+        raise JSONDecodeError("Unterminated array of rows", buffer, position)
+
+
+def get_base_course_code(dbh_course_code: str):
+    """
+    Course codes in DBH include a version number, e.g TDT4100-1.
+    """
+    return dbh_course_code.rsplit("-", 1)[0]
+
+
+def get_course_code_version(dbh_course_code: str):
+    _, _, version = dbh_course_code.rpartition("-")
+    return int(version) if version.isdigit() else 0
+
+
+def sort_rows_by_version(rows: Iterable[Mapping]):
+    """
+    Sort the rows of a course by version, keeping the order of the rows of each version.
+    The rows of the highest version, which take precedence, come last.
+    """
+    return sorted(rows, key=lambda row: get_course_code_version(row["Emnekode"]))
+
+
+def get_latest_version_rows(rows: Iterable[Mapping]):
+    """
+    The rows of the highest version of a course, e.g. of TDT4100-2 when there are rows for TDT4100-1 as well.
+    """
+    rows = list(rows)
+    if not rows:
+        return rows
+    latest_version = max(get_course_code_version(row["Emnekode"]) for row in rows)
+    return [
+        row
+        for row in rows
+        if get_course_code_version(row["Emnekode"]) == latest_version
+    ]
+
+
+def iter_rows_by_course_code(rows: Iterable[Mapping]):
+    """
+    Group rows sorted by course code, e.g. from get_all_grades, as (course code, rows).
+    """
+    for course_code, course_rows in groupby(rows, key=itemgetter("Emnekode")):
+        yield course_code, list(course_rows)
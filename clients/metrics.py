@@ -0,0 +1,86 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+def get_percentile(sorted_values, percentile: float):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class StageTimings:
+    def __init__(self):
+        self.wall_times = []
+        self.cpu_time = 0.0
+
+    def get_summary(self):
+        wall_times = sorted(self.wall_times)
+        return {
+            "count": len(wall_times),
+            "wall_total": sum(wall_times),
+            "cpu_total": self.cpu_time,
+            "p50": get_percentile(wall_times, 50),
+            "p90": get_percentile(wall_times, 90),
+            "p99": get_percentile(wall_times, 99),
+            "max": wall_times[-1] if wall_times else 0.0,
+        }
+
+
+class Metrics:
+    """
+    Per-stage wall and CPU timers and counters, shared by every thread of a process.
+
+    CPU time is measured for the thread running the stage.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.stages = defaultdict(StageTimings)
+            self.counters = defaultdict(int)
+
+    @contextmanager
+    def timer(self, stage: str):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.thread_time() - cpu_start
+            with self.lock:
+                timings = self.stages[stage]
+                timings.wall_times.append(wall_time)
+                timings.cpu_time += cpu_time
+
+    def increment(self, counter: str, amount: int = 1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def get_summary(self):
+        with self.lock:
+            return {
+                "started_at": self.started_at,
+                "elapsed": time.time() - self.started_at,
+                "stages": {
+                    stage: timings.get_summary()
+                    for stage, timings in sorted(self.stages.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def to_json(self, **extra):
+        return json.dumps({**self.get_summary(), **extra}, indent=2)
+
+
+# Metrics of the current process, e.g. a run of scripts/grades_sync.py
+metrics = Metrics()
@@ -1,11 +1,27 @@
-from typing import List
+import codecs
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import product
+from operator import itemgetter
+from typing import Iterable, List
 from django.db.models import TextChoices
 from json import JSONDecodeError
 
+import requests
+
+from .cache import CacheMiss
 from .client import Client
+from .dbh_records import get_latest_version_rows, iter_dbh_records
+from .metrics import metrics
 
 from grades.models import Semester, Course, Grade
-from grades.utils import update_course_stats
+from grades.utils import (
+    update_course_stats,
+    update_courses_stats,
+    defer_course_stats_update,
+)
 
 """
 API documentation can be found at:
@@ -33,6 +49,12 @@ class NSDClient(Client):
     code_text = True  # Should names of related resources be included?
     decimal_separator = "."
     table_id = 0
+    cache_ttl = timedelta(days=1)
+    first_year = 2000  # Tables are not expected to have rows from before this year
+    # Chunked queries are fetched by this many threads, and each chunk is tried this many times
+    chunk_workers = 4
+    chunk_tries = 3
+    chunk_backoff_factor = 1.0
 
     def __init__(self):
         super().__init__()
@@ -70,6 +92,20 @@ class NSDClient(Client):
             name="Årstall", filter_type=FilterType.ITEM, values=[str(year)]
         )
 
+    def get_years_filter(self, years: Iterable[int]):
+        return self.create_filter(
+            name="Årstall",
+            filter_type=FilterType.ITEM,
+            values=[str(year) for year in years],
+        )
+
+    def get_department_filter(self, department_codes: Iterable[str]):
+        return self.create_filter(
+            name="Avdelingskode",
+            filter_type=FilterType.ITEM,
+            values=list(department_codes),
+        )
+
     def get_semester_id(self, semester: Semester):
         lookup = {
             Semester.SPRING: 1,
@@ -112,14 +148,128 @@ class NSDClient(Client):
 
     def get_result_from_query(self, query):
         url = self.get_json_table_url()
-        response = self.session.post(url, json=query)
-
-        try:
-            results = response.json()
-        except JSONDecodeError:
-            results = []
+        with metrics.timer("dbh_query"):
+            response = self.request("POST", url, json=query)
+
+            try:
+                results = response.json()
+            except JSONDecodeError:
+                results = []
+        metrics.increment("dbh_rows", len(results))
         return results
 
+    def stream_result_from_query(
+        self, query, chunk_size: int = 64 * 1024, raise_for_status: bool = False
+    ):
+        """
+        Yield the rows of the result as compact DBHRecords while the response is downloaded,
+        without holding the whole response body or a dict per row in memory.
+        """
+        url = self.get_json_table_url()
+        # Includes the time spent by the consumer between rows, which is small when the rows are collected
+        with metrics.timer("dbh_download"):
+            response = self.request("POST", url, json=query, stream=True)
+
+            with response:
+                if raise_for_status:
+                    response.raise_for_status()
+                decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(
+                    errors="replace"
+                )
+                chunks = (
+                    decoder.decode(chunk) for chunk in response.iter_content(chunk_size)
+                )
+                row_count = 0
+                try:
+                    for record in iter_dbh_records(chunks):
+                        row_count += 1
+                        yield record
+                finally:
+                    metrics.increment("dbh_rows", row_count)
+
+    def get_chunk_queries(
+        self,
+        group_by: List[str],
+        sort_by: List[str],
+        filters: List[dict],
+        years: Iterable[int],
+        department_codes: Iterable[str] = None,
+    ):
+        """
+        Split a query into a query per year, and per department when `department_codes` are given.
+        Rows of departments which are not in `department_codes` are not included in any chunk.
+        """
+        chunk_filters = [[self.get_years_filter([year])] for year in years]
+        if department_codes:
+            chunk_filters = [
+                year_filters + [self.get_department_filter([department_code])]
+                for year_filters, department_code in product(
+                    chunk_filters, department_codes
+                )
+            ]
+        return [
+            self.build_query(group_by, sort_by, filters + extra_filters)
+            for extra_filters in chunk_filters
+        ]
+
+    def get_chunk(self, query):
+        for attempt in range(self.chunk_tries):
+            try:
+                return list(self.stream_result_from_query(query, raise_for_status=True))
+            except CacheMiss:
+                # Requesting a chunk missing from a replay only cache again can't find it
+                raise
+            except (requests.RequestException, JSONDecodeError) as error:
+                if attempt == self.chunk_tries - 1:
+                    raise
+                delay = self.chunk_backoff_factor * 2**attempt
+                print(f"Failed to get DBH chunk ({error!r}), retrying in {delay}s")
+                metrics.increment("dbh_chunk_retries")
+                time.sleep(delay)
+
+    def stream_chunked_result(self, queries: List[dict], sort_by: List[str]):
+        """
+        Fetch chunks of a query in parallel, and yield their rows merged in the order of `sort_by`.
+        A chunk which fails is retried by itself, and only fails the whole result after `chunk_tries`.
+
+        Every chunk is fetched in full before the first row is yielded, since a chunk can only be retried
+        as a whole and has to be sorted again. The rows of all chunks are therefore held in memory at once,
+        as compact DBHRecords.
+        """
+        with ThreadPoolExecutor(max_workers=self.chunk_workers) as executor:
+            chunks = list(executor.map(self.get_chunk, queries))
+
+        key = itemgetter(*sort_by)
+        # Sorted again, since DBH may not sort the same way as Python compares strings
+        yield from heapq.merge(*(sorted(chunk, key=key) for chunk in chunks), key=key)
+
+    def get_table(
+        self,
+        group_by: List[str],
+        sort_by: List[str],
+        filters: List[dict],
+        stream: bool = False,
+        years: Iterable[int] = None,
+        department_codes: Iterable[str] = None,
+    ):
+        """
+        Get every row of the table matching the filters. With `years`, only the rows of those years are
+        fetched, in a chunk per year (and department) which are merged in the same order as a single query.
+        """
+        if years is None:
+            query = self.build_query(group_by, sort_by, filters)
+            if stream:
+                return self.stream_result_from_query(query)
+            return self.get_result_from_query(query)
+
+        queries = self.get_chunk_queries(
+            group_by, sort_by, filters, years, department_codes
+        )
+        rows = self.stream_chunked_result(queries, sort_by)
+        if stream:
+            return rows
+        return [dict(row) for row in rows]
+
 
 class NSDGradeClient(NSDClient):
     table_id = 308
@@ -130,16 +280,21 @@ class NSDGradeClient(NSDClient):
         ]
         if len(grade_results) == 0:
             return 0
-        elif len(grade_results) > 1:
-            # Some codes have different course versions like -2. Use the highest version
-            grade_results.sort(key=lambda r: r["Emnekode"], reverse=True)
 
         grade_result = grade_results[0]
         return int(grade_result.get("Antall kandidater totalt"))
 
     def build_grade_data_from_results(
-        self, results, course_code: str, year: int, semester: Semester
+        self,
+        results,
+        course_code: str,
+        year: int,
+        semester: Semester,
+        course_id: int = None,
     ):
+        # Some codes have different course versions like -2. Use the highest version
+        results = get_latest_version_rows(results)
+
         average_grade = 0
         passed = self.resolve_result_for_grade(results, "G")
         failed = self.resolve_result_for_grade(results, "H")
@@ -174,11 +329,8 @@ class NSDGradeClient(NSDClient):
                 average_grade = (a * 5.0 + b * 4 + c * 3 + d * 2 + e) / student_count
             passed = 0
 
-        course_id = Course.all_objects.filter(code=course_code).values("id").first()
-        if course_id:
-            course_id = course_id["id"]
-        else:
-            raise ValueError(f"Course with code {course_code} does not exist")
+        if course_id is None:
+            course_id = self.get_course_id(course_code)
 
         data = {
             "a": a,
@@ -196,17 +348,28 @@ class NSDGradeClient(NSDClient):
 
         return data
 
+    @staticmethod
+    def get_course_id(course_code: str):
+        course_id = Course.all_objects.filter(code=course_code).values("id").first()
+        if not course_id:
+            raise ValueError(f"Course with code {course_code} does not exist")
+        return course_id["id"]
+
+    @staticmethod
+    def has_candidates(grade_data):
+        return not (
+            grade_data.get("average_grade") == 0
+            and grade_data.get("passed") == 0
+            and grade_data.get("f") == 0
+        )
+
     def build_grade_from_data(self, grade_data):
         course_id = grade_data.get("course_id")
         semester = grade_data.get("semester")
         year = grade_data.get("year")
 
         # Don't import grades with no candidates
-        if (
-            grade_data.get("average_grade") == 0
-            and grade_data.get("passed") == 0
-            and grade_data.get("f") == 0
-        ):
+        if not self.has_candidates(grade_data):
             return
 
         try:
@@ -222,12 +385,57 @@ class NSDGradeClient(NSDClient):
             ).update(**grade_data)
             grade.refresh_from_db()
 
-            update_course_stats(grade.course)
+            if not defer_course_stats_update(grade.course_id):
+                update_course_stats(grade.course)
         except Grade.DoesNotExist:
             grade = Grade.objects.create(**grade_data)
 
         return Grade.all_objects.get(pk=grade.id)
 
+    @staticmethod
+    def get_grade_key(grade_data):
+        return grade_data["course_id"], grade_data["semester"], int(grade_data["year"])
+
+    def build_grades_from_data(self, grades_data: List[dict]):
+        """
+        Create or update grades for any number of courses in a single statement.
+        """
+        # Don't import grades with no candidates. A semester can only be upserted once per statement.
+        grades_data = {
+            self.get_grade_key(grade_data): grade_data
+            for grade_data in grades_data
+            if self.has_candidates(grade_data)
+        }
+        if not grades_data:
+            return []
+
+        Grade.all_objects.bulk_create(
+            [Grade(**grade_data) for grade_data in grades_data.values()],
+            update_conflicts=True,
+            unique_fields=["course", "semester", "year"],
+            update_fields=[
+                "average_grade",
+                "passed",
+                "a",
+                "b",
+                "c",
+                "d",
+                "e",
+                "f",
+            ],
+        )
+
+        course_ids = {course_id for course_id, _, _ in grades_data}
+        # Saving in bulk does not send the signal which keeps the course stats up to date
+        if not defer_course_stats_update(*course_ids):
+            update_courses_stats(course_ids)
+
+        grades = {
+            (grade.course_id, grade.semester, grade.year): grade
+            for grade in Grade.all_objects.filter(course_id__in=course_ids)
+        }
+        return [grades[grade_key] for grade_key in grades_data]
+
     def get_grades_for_semester(self, course_code: str, year: int, semester: Semester):
         group_by = ["Institusjonskode", "Avdelingskode", "Emnekode", "Karakter"]
         sort_by = ["Institusjonskode", "Avdelingskode"]
@@ -256,7 +464,12 @@ class NSDGradeClient(NSDClient):
         query = self.build_query(group_by, sort_by, filters)
         return self.get_result_from_query(query)
 
-    def get_all_grades(self):
+    def get_all_grades(
+        self,
+        stream: bool = False,
+        years: Iterable[int] = None,
+        department_codes: Iterable[str] = None,
+    ):
         group_by = [
             "Institusjonskode",
             "Emnekode",
@@ -268,8 +481,9 @@ class NSDGradeClient(NSDClient):
         sort_by = ["Emnekode", "Årstall", "Semester"]
         filters = [self.get_institution_filter()]
 
-        query = self.build_query(group_by, sort_by, filters)
-        return self.get_result_from_query(query)
+        return self.get_table(
+            group_by, sort_by, filters, stream, years, department_codes
+        )
 
 
 class NSDCourseClient(NSDClient):
@@ -300,10 +514,16 @@ class NSDCourseClient(NSDClient):
         query = self.build_query(group_by, sort_by, filters)
         return self.get_result_from_query(query)
 
-    def get_all_courses(self):
+    def get_all_courses(
+        self,
+        stream: bool = False,
+        years: Iterable[int] = None,
+        department_codes: Iterable[str] = None,
+    ):
         group_by = []
         sort_by = ["Emnekode", "Årstall", "Semester"]
         filters = [self.get_institution_filter(), self.get_task_filter()]
 
-        query = self.build_query(group_by, sort_by, filters)
-        return self.get_result_from_query(query)
+        return self.get_table(
+            group_by, sort_by, filters, stream, years, department_codes
+        )
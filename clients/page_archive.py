@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from .files import atomic_write
+from .metrics import metrics
+
+
+class PageArchive:
+    """
+    Compressed archive of fetched course pages, so course data can be extracted again without network.
+
+    Pages are stored gzipped once per distinct content, addressed by the SHA-256 of the page. An index maps
+    the course code, year and language of every page to its content, and is updated when a page is fetched
+    again. The current page of a course is stored as year 0.
+
+    The index is a SQLite database, so several processes, like the shards of a sync, can archive into the same
+    directory.
+    """
+
+    index_name = "index.sqlite3"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                os.path.join(self.directory, self.index_name),
+                timeout=30,
+                check_same_thread=False,
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "code TEXT NOT NULL, year INTEGER NOT NULL, language TEXT NOT NULL, "
+                "digest TEXT NOT NULL, archived_at REAL NOT NULL, "
+                "PRIMARY KEY (code, year, language))"
+            )
+        return self._connection
+
+    def get_path(self, digest: str):
+        return os.path.join(self.directory, "pages", digest[:2], f"{digest}.html.gz")
+
+    def store(self, code: str, year: int, language: str, text: str):
+        content = text.encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.get_path(digest)
+        if os.path.exists(path):
+            metrics.increment("archive_pages_deduplicated")
+        else:
+            with atomic_write(path) as page_file:
+                page_file.write(gzip.compress(content, mtime=0))
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                (code, year or 0, language, digest, time.time()),
+            )
+        return digest
+
+    def load(self, code: str, year: int, language: str):
+        """
+        The text of an archived page, or None when the page is not archived.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT digest FROM pages WHERE code = ? AND year = ? AND language = ?",
+                (code, year or 0, language),
+            ).fetchone()
+        if row is None:
+            return None
+        with open(self.get_path(row[0]), "rb") as page_file:
+            return gzip.decompress(page_file.read()).decode("utf-8")
+
+    def has_page(self, code: str, year: int, language: str):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM pages WHERE code = ? AND year = ? AND language = ?",
+                (code, year or 0, language),
+            ).fetchone()
+        return row is not None
+
+    def get_codes(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT code FROM pages ORDER BY code"
+            ).fetchall()
+        return [code for (code,) in rows]
+
+    def get_years(self, code: str, language: str = "no"):
+        """
+        The archived years of the pages of a course, the current page first as None, then from the newest.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT year FROM pages WHERE code = ? AND language = ? "
+                "ORDER BY year = 0 DESC, year DESC",
+                (code, language),
+            ).fetchall()
+        return [year or None for (year,) in rows]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,30 @@
+"""
+Extraction of course data from archived course pages in worker processes, see ReparseService.
+
+Kept free of Django, so the workers can be started with any multiprocessing start method.
+"""
+
+from .client import Client
+from .course_pages import ArchivedCoursePagesClient
+from .page_archive import PageArchive
+
+# Client of the worker process, created by init_worker
+client: ArchivedCoursePagesClient = None
+
+
+def init_worker(archive_directory: str, html_parser: str):
+    global client
+    Client.html_parser = html_parser
+    client = ArchivedCoursePagesClient(PageArchive(archive_directory))
+
+
+def reparse_course(course):
+    """
+    Extract the course data of a (code, English name) pair. Returns the code, the course data or None when no
+    archived page has course info, and the error when extraction failed.
+    """
+    code, english_name = course
+    try:
+        return code, client.get_archived_course_data(code, english_name), None
+    except Exception as error:
+        return code, None, repr(error)
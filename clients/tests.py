@@ -0,0 +1,716 @@
+import json as json_module
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+from bs4.builder import builder_registry
+from django.test import SimpleTestCase, TestCase
+
+from grades.models import Course, Faculty, Grade, Semester
+
+from .cache import CacheMiss
+from .client import FALLBACK_HTML_PARSER, HTML_PARSERS, Client
+from .corpus import CorpusCoursePagesClient, read_corpus
+from .course_pages import (
+    ArchivedCoursePagesClient,
+    CoursePagesClient,
+    PageNotArchived,
+)
+from .dbh_records import iter_dbh_records, sort_rows_by_version
+from .metrics import Metrics, metrics
+from .nsd import NSDGradeClient
+from .page_archive import PageArchive
+from .tia import TIAFacultyClient
+from .throttle import HostThrottle, TokenBucket
+from .transport import Transport
+
+
+def build_response(status_code=200, content=b"", headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = content
+    response.url = "https://example.com/"
+    return response
+
+
+class CachedClient(Client):
+    cache_ttl = timedelta(hours=1)
+
+
+class ResponseCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(setattr, Client, "cache", None)
+        Client.use_cache(directory.name)
+        self.client = CachedClient()
+        self.session = mock.Mock()
+
+    def test_fresh_response_is_served_from_cache(self):
+        self.session.request.return_value = build_response(content=b"page")
+
+        first = self.client.request("GET", "https://example.com/", session=self.session)
+        second = self.client.request(
+            "GET", "https://example.com/", session=self.session
+        )
+
+        self.assertEqual(first.content, b"page")
+        self.assertEqual(second.content, b"page")
+        self.assertEqual(self.session.request.call_count, 1)
+
+    def test_request_body_is_part_of_key(self):
+        self.session.request.side_effect = [
+            build_response(content=b"first"),
+            build_response(content=b"second"),
+        ]
+
+        first = self.client.request(
+            "POST", "https://example.com/", session=self.session, json={"id": 1}
+        )
+        second = self.client.request(
+            "POST", "https://example.com/", session=self.session, json={"id": 2}
+        )
+
+        self.assertEqual(first.content, b"first")
+        self.assertEqual(second.content, b"second")
+
+    def test_stale_response_is_revalidated(self):
+        self.session.request.side_effect = [
+            build_response(content=b"page", headers={"ETag": '"v1"'}),
+            build_response(status_code=304),
+        ]
+
+        self.client.request("GET", "https://example.com/", session=self.session)
+        with mock.patch.object(CachedClient, "cache_ttl", timedelta(0)):
+            response = self.client.request(
+                "GET", "https://example.com/", session=self.session
+            )
+
+        self.assertEqual(response.content, b"page")
+        _, kwargs = self.session.request.call_args
+        self.assertEqual(kwargs["headers"]["If-None-Match"], '"v1"')
+
+    def test_replay_only(self):
+        self.session.request.return_value = build_response(content=b"page")
+        self.client.request("GET", "https://example.com/", session=self.session)
+        self.client.cache.replay_only = True
+
+        response = self.client.request(
+            "GET", "https://example.com/", session=self.session
+        )
+
+        self.assertEqual(response.content, b"page")
+        self.assertEqual(self.session.request.call_count, 1)
+        with self.assertRaises(CacheMiss):
+            self.client.request(
+                "GET", "https://example.com/other", session=self.session
+            )
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_rate_after_burst(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+        started_at = time.monotonic()
+        for _ in range(15):
+            bucket.acquire()
+        elapsed = time.monotonic() - started_at
+
+        # The first 5 are let through at once, the next 10 at 100 per second
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertLess(elapsed, 0.5)
+
+    def test_host_throttle_rate_is_per_host(self):
+        throttle = HostThrottle(rate=20)
+        started_at = time.monotonic()
+        for url in ["https://a.example.com/", "https://b.example.com/"] * 20:
+            with throttle.limit(url):
+                pass
+        elapsed = time.monotonic() - started_at
+
+        # Each host bursts 20 requests at once, so neither waits for the other
+        self.assertLess(elapsed, 0.2)
+        started_at = time.monotonic()
+        with throttle.limit("https://a.example.com/"):
+            pass
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.03)
+
+
+class MetricsTest(SimpleTestCase):
+    def test_summary(self):
+        metrics = Metrics()
+        for _ in range(10):
+            with metrics.timer("stage"):
+                pass
+        metrics.increment("rows", 3)
+        metrics.increment("rows")
+
+        summary = metrics.get_summary()
+        stage = summary["stages"]["stage"]
+        self.assertEqual(stage["count"], 10)
+        self.assertLessEqual(stage["p50"], stage["p90"])
+        self.assertLessEqual(stage["p99"], stage["max"])
+        self.assertEqual(summary["counters"], {"rows": 4})
+
+
+class ChunkedDBHTableTest(SimpleTestCase):
+    rows_by_year = {
+        "2020": [
+            {"Emnekode": "TDT4100-1", "Årstall": "2020", "Semester": "1"},
+            {"Emnekode": "TMA4100-1", "Årstall": "2020", "Semester": "3"},
+        ],
+        "2021": [
+            {"Emnekode": "TDT4100-1", "Årstall": "2021", "Semester": "1"},
+            {"Emnekode": "TDT4110-1", "Årstall": "2021", "Semester": "3"},
+        ],
+    }
+
+    def setUp(self):
+        self.client = NSDGradeClient()
+        self.client.chunk_backoff_factor = 0
+        self.failed_years = set()
+        self.truncate = False
+
+    def request(self, method, url, json=None, **kwargs):
+        year_filter = next(
+            table_filter
+            for table_filter in json["filter"]
+            if table_filter["variabel"] == "Årstall"
+        )
+        [year] = year_filter["selection"]["values"]
+        content = json_module.dumps(self.rows_by_year[year]).encode("utf-8")
+        # Every year fails once
+        if year not in self.failed_years:
+            self.failed_years.add(year)
+            if not self.truncate:
+                raise requests.exceptions.ConnectionError("Timed out")
+            content = content[: len(content) // 2]
+
+        response = build_response(content=content)
+        response._content_consumed = True
+        return response
+
+    def test_chunks_are_retried_and_merged_in_order(self):
+        with mock.patch.object(self.client.session, "request", self.request):
+            rows = list(self.client.get_all_grades(stream=True, years=[2020, 2021]))
+
+        self.assertEqual(
+            [(row["Emnekode"], row["Årstall"]) for row in rows],
+            [
+                ("TDT4100-1", "2020"),
+                ("TDT4100-1", "2021"),
+                ("TDT4110-1", "2021"),
+                ("TMA4100-1", "2020"),
+            ],
+        )
+
+    def test_truncated_chunks_are_retried(self):
+        self.truncate = True
+        with mock.patch.object(self.client.session, "request", self.request):
+            rows = list(self.client.get_all_grades(stream=True, years=[2020, 2021]))
+
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(self.failed_years, {"2020", "2021"})
+
+    def test_cache_misses_are_not_retried(self):
+        request = mock.Mock(side_effect=CacheMiss("Not cached"))
+        with mock.patch.object(self.client.session, "request", request):
+            with self.assertRaises(CacheMiss):
+                list(self.client.get_all_grades(stream=True, years=[2020]))
+
+        self.assertEqual(request.call_count, 1)
+
+
+class BulkGradesTest(TestCase):
+    def setUp(self):
+        self.client = NSDGradeClient()
+        self.course = Course.all_objects.create(code="TDT4100", norwegian_name="Test")
+        self.other_course = Course.all_objects.create(
+            code="TMA4100", norwegian_name="Test"
+        )
+        Grade.all_objects.create(
+            course=self.course,
+            year=2020,
+            semester=Semester.AUTUMN,
+            average_grade=1.0,
+            e=1,
+            digital_exam=True,
+            digital_exam_checked=True,
+        )
+
+    def build_grade_data(self, course, year: int, a: int = 0, f: int = 0):
+        return {
+            "course_id": course.id,
+            "semester": Semester.AUTUMN,
+            "year": year,
+            "a": a,
+            "b": 0,
+            "c": 0,
+            "d": 0,
+            "e": 0,
+            "f": f,
+            "passed": 0,
+            "average_grade": 5.0 * a / (a + f) if a + f else 0,
+        }
+
+    def test_grades_of_several_courses_are_upserted(self):
+        grades = self.client.build_grades_from_data(
+            [
+                self.build_grade_data(self.course, 2020, a=2),
+                self.build_grade_data(self.course, 2021, a=1, f=1),
+                self.build_grade_data(self.other_course, 2020, a=3),
+                # Without candidates
+                self.build_grade_data(self.other_course, 2021),
+            ]
+        )
+
+        self.assertEqual(
+            [(grade.course_id, grade.year) for grade in grades],
+            [
+                (self.course.id, 2020),
+                (self.course.id, 2021),
+                (self.other_course.id, 2020),
+            ],
+        )
+        self.assertEqual(Grade.all_objects.count(), 3)
+        updated = Grade.all_objects.get(course=self.course, year=2020)
+        self.assertEqual((updated.a, updated.e, updated.average_grade), (2, 0, 5.0))
+        # Fields which are not read from DBH are kept
+        self.assertTrue(updated.digital_exam)
+        self.assertTrue(updated.digital_exam_checked)
+
+        self.course.refresh_from_db()
+        self.other_course.refresh_from_db()
+        self.assertEqual(self.course.attendee_count, 4)
+        self.assertEqual(self.course.average, 3.75)
+        self.assertEqual(self.other_course.attendee_count, 3)
+
+    def test_last_data_of_a_semester_is_used(self):
+        grades = self.client.build_grades_from_data(
+            [
+                self.build_grade_data(self.course, 2021, a=1),
+                self.build_grade_data(self.course, 2021, a=4),
+            ]
+        )
+
+        self.assertEqual([grade.a for grade in grades], [4])
+
+    def test_no_grades_data(self):
+        self.assertEqual(self.client.build_grades_from_data([]), [])
+
+
+class DBHRecordsTest(SimpleTestCase):
+    text = json_module.dumps(
+        [
+            {"Emnekode": "TDT4100-1", "Navn": 'Objekt "orientert"', "Antall": 10},
+            {"Emnekode": "TMA4100-1", "Navn": "Matematikk \\ 1 \u00e6", "Snitt": 1.5},
+            {"Emnekode": "TFY4125-1", "Navn": None, "Antall": 1234},
+        ]
+    )
+
+    def test_rows_split_at_any_position_are_decoded(self):
+        expected = json_module.loads(self.text)
+        for first in range(1, len(self.text)):
+            for second in range(first, len(self.text), 7):
+                chunks = [
+                    self.text[:first],
+                    self.text[first:second],
+                    self.text[second:],
+                ]
+                with self.subTest(chunks=chunks):
+                    records = list(iter_dbh_records(chunks))
+                    self.assertEqual([dict(record) for record in records], expected)
+
+    def test_truncated_array_raises(self):
+        for end in range(1, len(self.text)):
+            with self.subTest(end=end):
+                with self.assertRaises(json_module.JSONDecodeError):
+                    list(iter_dbh_records([self.text[:end]]))
+
+    def test_other_values_yield_no_rows(self):
+        for text in ["", '{"error": "Not found"}']:
+            with self.subTest(text=text):
+                self.assertEqual(list(iter_dbh_records([text])), [])
+
+
+class CourseCodeVersionTest(SimpleTestCase):
+    def test_highest_version_is_used_for_a_semester(self):
+        rows = [
+            {
+                "Emnekode": "TDT4100-10",
+                "Karakter": "A",
+                "Antall kandidater totalt": "3",
+            },
+            {"Emnekode": "TDT4100-9", "Karakter": "A", "Antall kandidater totalt": "7"},
+            {"Emnekode": "TDT4100-9", "Karakter": "B", "Antall kandidater totalt": "2"},
+        ]
+
+        grade_data = NSDGradeClient().build_grade_data_from_results(
+            rows, "TDT4100", 2020, "SPRING", course_id=1
+        )
+
+        self.assertEqual((grade_data["a"], grade_data["b"]), (3, 0))
+
+    def test_rows_are_sorted_by_version(self):
+        rows = [
+            {"Emnekode": "TDT4100-10", "Årstall": "2019"},
+            {"Emnekode": "TDT4100-2", "Årstall": "2021"},
+            {"Emnekode": "TDT4100", "Årstall": "2022"},
+        ]
+
+        self.assertEqual(
+            [row["Emnekode"] for row in sort_rows_by_version(rows)],
+            ["TDT4100", "TDT4100-2", "TDT4100-10"],
+        )
+
+
+COURSE_PAGE_NO = """<!DOCTYPE html>
+<html><head><title>TDT4100 - Objektorientert programmering - sensor- og - test - NTNU</title></head>
+<body>
+<div id="course-details">
+  <h1>TDT4100 - Objektorientert programmering</h1>
+  <div class="course-fact"><div class="course-fact-label">Studiepoeng</div>
+    <div class="course-fact-value">7,5</div></div>
+  <div class="course-fact"><div class="course-fact-label">Nivå</div>
+    <div class="course-fact-value">Grunnleggende emner, nivå I</div></div>
+  <div class="course-fact"><div class="course-fact-label">Undervisningsstart</div>
+    <div class="course-fact-value">Vår 2024</div></div>
+  <div class="course-fact"><div class="course-fact-label">Undervisningsspråk</div>
+    <div class="course-fact-value">Norsk</div></div>
+  <div class="course-fact"><div class="course-fact-label">Sted</div>
+    <div class="course-fact-value">Sted
+      Trondheim</div></div>
+  <div class="course-fact"><div class="course-fact-label">Vurderingsordning</div>
+    <div class="course-fact-value">Skriftlig   eksamen</div></div>
+</div>
+<div id="course-content-toggler">Innledning<p>Objektorientert&nbsp;programmering i Java.</p>
+  <ul><li>Klasser</li><li>Arv<br>og grensesnitt</li></ul></div>
+<div id="learning-method-toggler"><p>Se engelsk versjon</p></div>
+<div id="learning-goal-toggler"><ol><li>Kunnskap</li><li>Ferdigheter</li></ol></div>
+<div id="omEksamen"><h3 class="grade-rule-heading">Karakter: Bokstavkarakterer</h3>
+  <a href="#">Inspera Assessment</a>
+  <dl>
+    <dt><span class="exam-term">Høst</span> <span class="exam-system">INSPERA</span></dt>
+    <dt><span class="exam-term">Sommer</span> <span class="exam-system">PAPIR</span></dt>
+  </dl></div>
+</body></html>
+"""
+
+COURSE_PAGE_ENG = """<!DOCTYPE html>
+<html><head><title>TDT4100 - Object Oriented Programming - NTNU</title></head>
+<body>
+<div id="course-details"><h1>TDT4100 - Object Oriented Programming</h1></div>
+<div id="learning-method-toggler"><p>Lectures and <em>exercises</em>.</p></div>
+</body></html>
+"""
+
+
+class HTMLParserParityTest(SimpleTestCase):
+    def setUp(self):
+        self.parser = Client.html_parser
+
+    def tearDown(self):
+        Client.html_parser = self.parser
+
+    def extract_course_data(self, parser, partial: bool = False):
+        client = CoursePagesClient()
+        client.html_parser = parser
+        init_soup = client.init_course_soup if partial else client.init_soup
+        soup_no = init_soup(client.normalize(COURSE_PAGE_NO))
+        soup_eng = init_soup(client.normalize(COURSE_PAGE_ENG))
+        return client.extract_course_data("TDT4100", soup_no, soup_eng)
+
+    def test_course_data_is_identical_across_parsers(self):
+        expected = self.extract_course_data(FALLBACK_HTML_PARSER)
+        self.assertEqual(expected["credit"], 7.5)
+        self.assertEqual(expected["learning_form"], "Lectures and\nexercises\n.")
+        self.assertTrue(expected["has_had_digital_exam"])
+
+        for parser in HTML_PARSERS:
+            with self.subTest(parser=parser):
+                if builder_registry.lookup(parser) is None:
+                    self.skipTest(f"{parser} is not installed")
+                self.assertEqual(self.extract_course_data(parser), expected)
+                self.assertEqual(self.extract_course_data(parser, True), expected)
+
+    def test_partial_parsing_only_builds_the_regions(self):
+        client = CoursePagesClient()
+        client.html_parser = "html.parser"
+        soup = client.init_course_soup(
+            COURSE_PAGE_NO.replace("<body>", "<body><nav><p>Meny</p></nav>")
+        )
+
+        self.assertIsNone(soup.find("nav"))
+        self.assertEqual(len(soup.select(".course-fact")), 6)
+        self.assertIsNotNone(soup.title)
+
+    def test_missing_parser_falls_back_to_html5lib(self):
+        with mock.patch.object(builder_registry, "lookup", return_value=None):
+            self.assertEqual(Client.use_parser("lxml"), FALLBACK_HTML_PARSER)
+        self.assertEqual(Client.html_parser, FALLBACK_HTML_PARSER)
+
+        with self.assertRaises(ValueError):
+            Client.use_parser("regex")
+
+
+class ExamTermsTest(SimpleTestCase):
+    def test_exam_terms_are_read_from_the_exam_table(self):
+        client = CoursePagesClient()
+        regions, _ = client.find_regions(client.init_course_soup(COURSE_PAGE_NO))
+        self.assertEqual(
+            client.extract_exam_terms(regions["omEksamen"]),
+            {"Høst": True, "Sommer": False},
+        )
+        self.assertEqual(client.extract_exam_terms(None), {})
+
+
+class CoursePageCorpusTest(SimpleTestCase):
+    def setUp(self):
+        pages, _ = read_corpus()
+        self.client = CorpusCoursePagesClient(pages)
+
+    def test_pages_without_course_info_have_no_course_data(self):
+        self.assertIsNone(self.client.get_course_data("EXPH0300"))
+        self.assertIsNone(self.client.get_course_data("TDT4105"))
+        self.assertEqual(self.client.pages_read, 2)
+
+    def test_sections_of_english_only_course_are_read_from_the_english_page(self):
+        data = self.client.get_course_data("TTK4250", english_name="Sensor Fusion")
+
+        self.assertTrue(data["taught_in_english"])
+        self.assertIn("Kalman filtering", data["content"])
+        self.assertIn("Python", data["learning_form"])
+        self.assertIn("State estimation", data["learning_goal"])
+
+
+class PageArchiveTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive = PageArchive(directory.name)
+        self.addCleanup(self.archive.close)
+
+    def test_identical_pages_are_stored_once(self):
+        first = self.archive.store("TDT4100", None, "no", COURSE_PAGE_NO)
+        second = self.archive.store("TDT4100", 2023, "no", COURSE_PAGE_NO)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.archive.load("TDT4100", 2023, "no"), COURSE_PAGE_NO)
+        self.assertIsNone(self.archive.load("TDT4100", 2023, "eng"))
+        self.assertEqual(self.archive.get_years("TDT4100"), [None, 2023])
+
+    def test_course_data_is_extracted_from_archived_pages(self):
+        client = CoursePagesClient()
+        pages = {
+            client.get_course_url(client.base_url_no, "TDT4100"): COURSE_PAGE_NO,
+            client.get_course_url(client.base_url_eng, "TDT4100"): COURSE_PAGE_ENG,
+        }
+        with (
+            mock.patch.object(client, "archive", self.archive),
+            mock.patch.object(
+                client,
+                "get_course_page",
+                lambda url, raise_for_status=False: pages[url],
+            ),
+        ):
+            expected = client.get_course_data("TDT4100")
+
+        archived_client = ArchivedCoursePagesClient(self.archive)
+        with mock.patch.object(archived_client, "get_course_page") as get_course_page:
+            data = archived_client.get_archived_course_data("TDT4100")
+
+        get_course_page.assert_not_called()
+        self.assertEqual(data.pop("last_course_page_year"), 0)
+        self.assertEqual(data, expected)
+        with self.assertRaises(PageNotArchived):
+            archived_client.get_page("TDT4100", 2023)
+
+    def test_sections_referring_to_an_english_page_which_is_not_archived_are_kept(
+        self,
+    ):
+        self.archive.store("TDT4100", None, "no", COURSE_PAGE_NO)
+        archived_client = ArchivedCoursePagesClient(self.archive)
+
+        data = archived_client.get_archived_course_data(
+            "TDT4100", english_name="Object-Oriented Programming"
+        )
+
+        self.assertEqual(data["english_name"], "Object-Oriented Programming")
+        # Left out, so the reparse keeps the current values of the course
+        sections = ArchivedCoursePagesClient.ENGLISH_SECTION_IDS
+        self.assertTrue(set(sections) - set(data))
+        for field in set(sections) & set(data):
+            self.assertFalse(archived_client.use_english_version(data[field]))
+
+
+class LazyEnglishCoursePageTest(SimpleTestCase):
+    def get_course_data(self, page_no, english_name=None):
+        client = CoursePagesClient()
+        urls = []
+
+        def get_course_page(url, raise_for_status=False):
+            urls.append(url)
+            if url.startswith(client.base_url_eng):
+                return client.normalize(COURSE_PAGE_ENG)
+            return client.normalize(page_no)
+
+        with mock.patch.object(client, "get_course_page", get_course_page):
+            data = client.get_course_data("TDT4100", english_name=english_name)
+        return data, len(urls)
+
+    def test_english_page_is_skipped_when_not_needed(self):
+        page_no = COURSE_PAGE_NO.replace("Se engelsk versjon", "Forelesninger")
+
+        data, requests_made = self.get_course_data(
+            page_no, "Object Oriented Programming"
+        )
+
+        self.assertEqual(requests_made, 1)
+        self.assertEqual(data["english_name"], "Object Oriented Programming")
+        self.assertEqual(data["learning_form"], "Forelesninger")
+
+    def test_english_page_is_fetched_for_sections_referring_to_it(self):
+        data, requests_made = self.get_course_data(COURSE_PAGE_NO, "OOP")
+
+        self.assertEqual(requests_made, 2)
+        self.assertEqual(data["english_name"], "OOP")
+        self.assertEqual(data["learning_form"], "Lectures and\nexercises\n.")
+
+    def test_english_page_is_fetched_for_unknown_english_name(self):
+        page_no = COURSE_PAGE_NO.replace("Se engelsk versjon", "Forelesninger")
+
+        data, requests_made = self.get_course_data(page_no)
+
+        self.assertEqual(requests_made, 2)
+        self.assertEqual(data["english_name"], "Object Oriented Programming")
+
+
+class FlakyRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        status = 200
+        if self.server.failures:
+            self.server.failures -= 1
+            status = 500
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+class TransportTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyRequestHandler)
+        self.server.failures = 0
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.transport = Transport(backoff_factor=0)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def get_counters(self):
+        return (
+            metrics.counters["http_requests"],
+            metrics.counters["http_connections_opened"],
+        )
+
+    def test_sessions_share_kept_alive_connections(self):
+        sessions = [self.transport.create_session() for _ in range(2)]
+        requests_before, connections_before = self.get_counters()
+
+        for session in sessions * 3:
+            self.assertEqual(session.get(self.url).text, "ok")
+
+        requests_after, connections_after = self.get_counters()
+        self.assertEqual(requests_after - requests_before, 6)
+        self.assertEqual(connections_after - connections_before, 1)
+
+    def test_failed_requests_are_retried(self):
+        session = self.transport.create_session()
+        self.server.failures = 2
+
+        self.assertEqual(session.get(self.url).status_code, 200)
+
+    def test_configure_replaces_the_adapters_of_existing_sessions(self):
+        session = self.transport.create_session()
+
+        self.transport.configure(host_pool_sizes={self.url: 2}, retries=0)
+        self.server.failures = 1
+
+        self.assertIs(
+            session.get_adapter(self.url), self.transport.host_adapters[self.url]
+        )
+        with self.assertRaises(requests.exceptions.RetryError):
+            session.get(self.url)
+
+
+def build_tia_faculty(number: int):
+    return {
+        "fs_stedref": {
+            "name": {
+                "akronym": f"F{number}",
+                "fullname_nob": f"Fakultet {number}",
+                "fullname_eng": f"Faculty {number}",
+            }
+        },
+        "orgreg2_org": {"ouId": number, "nsdCodes": [f"1150{number}"], "facNr": number},
+    }
+
+
+class TIARefreshAllTest(TestCase):
+    def setUp(self):
+        self.faculties = [build_tia_faculty(number) for number in range(1, 24)]
+        self.requested_skips = []
+
+    def request_list_content(self, limit, skip, total=True):
+        self.requested_skips.append(skip)
+        content = {"organisasjon": self.faculties[skip : skip + limit]}
+        if total:
+            content["total"] = len(self.faculties)
+        return content
+
+    def test_pages_are_requested_up_to_the_total(self):
+        client = TIAFacultyClient()
+        with mock.patch.object(
+            client, "request_list_content", self.request_list_content
+        ):
+            contents = list(client.iter_list_contents(limit=5))
+
+        self.assertEqual(sorted(self.requested_skips), [0, 5, 10, 15, 20])
+        self.assertEqual(
+            [len(content["organisasjon"]) for content in contents], [5, 5, 5, 5, 3]
+        )
+
+    def test_all_pages_are_written_without_a_total(self):
+        Faculty.objects.create(
+            acronym="OLD",
+            norwegian_name="Gammelt navn",
+            organization_unit_id=1,
+            nsd_code="11501",
+            faculty_id=1,
+        )
+        client = TIAFacultyClient()
+        client.page_workers = 2
+
+        def request_list_content(limit, skip):
+            return self.request_list_content(limit, skip, total=False)
+
+        with mock.patch.object(client, "request_list_content", request_list_content):
+            count = client.refresh_all(limit=5, batch_size=7)
+
+        self.assertEqual(count, 23)
+        self.assertEqual(Faculty.objects.count(), 23)
+        self.assertEqual(Faculty.objects.get(faculty_id=1).acronym, "F1")
+        self.assertNotIn(30, self.requested_skips)
@@ -0,0 +1,88 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+class HostThrottle:
+    """
+    Politeness limits shared by every thread using a client.
+
+    At most `max_concurrent` requests are in flight per host, and consecutive requests
+    to the same host are started at least `min_interval` seconds apart. With a `rate`, at most
+    `rate` requests per second are started to each host on average, in bursts of up to a second
+    of requests.
+    """
+
+    def __init__(
+        self, max_concurrent: int = 4, min_interval: float = 0.0, rate: float = None
+    ):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_request_at = {}
+        self._token_buckets = {}
+
+    def get_semaphore(self, host: str):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrent)
+            return self._semaphores[host]
+
+    def wait_for_turn(self, host: str):
+        with self._lock:
+            now = time.monotonic()
+            request_at = max(now, self._next_request_at.get(host, now))
+            self._next_request_at[host] = request_at + self.min_interval
+
+        delay = request_at - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def get_token_bucket(self, host: str):
+        with self._lock:
+            if host not in self._token_buckets:
+                self._token_buckets[host] = TokenBucket(
+                    self.rate, max(1, int(self.rate))
+                )
+            return self._token_buckets[host]
+
+    @contextmanager
+    def limit(self, url: str):
+        host = urlsplit(url).netloc
+        with self.get_semaphore(host):
+            self.wait_for_turn(host)
+            if self.rate:
+                self.get_token_bucket(host).acquire()
+            yield
+
+
+class TokenBucket:
+    """
+    Rate limit allowing `rate` requests per second on average, in bursts of up to `capacity` requests.
+    Shared by threads, which are let through one at a time.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def acquire(self):
+        with self._lock:
+            self.refill()
+            while self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
@@ -1,8 +1,14 @@
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 from grades.models import Course, Faculty, Department
+from grades.org_units import OrganizationUnitResolver
+from grades.search_adapters import update_courses_search_index
 
 from .feide import FeideClient
+from .metrics import metrics
 
 
 class TIAClient(FeideClient):
@@ -11,6 +17,8 @@ class TIAClient(FeideClient):
     model = None
     pk_field = None
     resource_name = None
+    # Pages of refresh_all are fetched by this many threads, sharing the logged in session
+    page_workers = 4
 
     def get_detail_url(self, object_id):
         return ""
@@ -33,6 +41,14 @@ class TIAClient(FeideClient):
     def get_resource_from_content_root(self, content_root: dict):
         return content_root.get(self.resource_name)
 
+    @staticmethod
+    def get_total_from_content_root(content_root: dict):
+        """
+        The number of objects in the whole list, or None when the response doesn't have it.
+        """
+        total = content_root.get("total")
+        return int(total) if total is not None else None
+
     def get_object_data_detail(self, object_id):
         content = self.request_detail_content(object_id)
         obj = self.get_resource_from_content_root(content)
@@ -41,7 +57,10 @@ class TIAClient(FeideClient):
 
     def get_object_data_list(self, limit: int, skip: int):
         content = self.request_list_content(limit, skip)
-        objects = self.get_resource_from_content_root(content)
+        return self.get_objects_data_from_content(content)
+
+    def get_objects_data_from_content(self, content: dict):
+        objects = self.get_resource_from_content_root(content) or []
         objects_data = []
         for obj in objects:
             object_data = self.resolve_data_for_object(obj)
@@ -76,6 +95,88 @@ class TIAClient(FeideClient):
         objects = self.build_objects_from_data(objects_data)
         return objects
 
+    def iter_list_contents(self, limit: int):
+        """
+        Yield the content of every page of the list, in order.
+
+        The first page is requested by itself, to find the total. The rest are requested by `page_workers`
+        threads, with at most `page_workers` pages in flight, up to the total. Without a total, pages are
+        requested until one is not full.
+        """
+        content = self.request_list_content(limit, 0)
+        yield content
+        total = self.get_total_from_content_root(content)
+        is_last = len(self.get_resource_from_content_root(content) or []) < limit
+        if total is None and is_last:
+            return
+
+        skip = limit
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+            while True:
+                while (
+                    len(pending) < self.page_workers
+                    and not is_last
+                    and (total is None or skip < total)
+                ):
+                    pending.append(
+                        executor.submit(self.request_list_content, limit, skip)
+                    )
+                    skip += limit
+                if not pending:
+                    return
+
+                content = pending.popleft().result()
+                metrics.increment("tia_pages")
+                objects = self.get_resource_from_content_root(content) or []
+                if total is None and len(objects) < limit:
+                    is_last = True
+                yield content
+
+    def write_objects_data(self, objects_data: List[dict], batch_size: int = 500):
+        """
+        Create or update any number of objects at once, in a statement per `batch_size` objects.
+        """
+        objects_data = {data[self.pk_field]: data for data in objects_data}
+        manager = self.model._base_manager
+        objects = manager.in_bulk(list(objects_data), field_name=self.pk_field)
+
+        new_objects = []
+        existing_objects = []
+        update_fields = set()
+        for object_pk, object_data in objects_data.items():
+            obj = objects.get(object_pk)
+            if obj is None:
+                objects[object_pk] = self.model(**object_data)
+                new_objects.append(objects[object_pk])
+                continue
+            for field, value in object_data.items():
+                setattr(obj, field, value)
+            existing_objects.append(obj)
+            update_fields.update(object_data)
+
+        manager.bulk_create(new_objects, batch_size=batch_size)
+        update_fields.discard(self.pk_field)
+        if existing_objects and update_fields:
+            manager.bulk_update(existing_objects, update_fields, batch_size=batch_size)
+        return new_objects + existing_objects
+
+    def refresh_all(self, limit: int = 100, batch_size: int = 500):
+        """
+        Refresh every object of the list, instead of a single page like refresh_objects. Pages are written
+        to the database in batches of `batch_size` objects as they arrive. Returns the number of objects.
+        """
+        count = 0
+        batch = []
+        for content in self.iter_list_contents(limit):
+            batch.extend(self.get_objects_data_from_content(content))
+            if len(batch) >= batch_size:
+                count += len(self.write_objects_data(batch, batch_size))
+                batch = []
+        count += len(self.write_objects_data(batch, batch_size))
+        metrics.increment("tia_objects_refreshed", count)
+        return count
+
     class Meta:
         abstract = True
 
@@ -97,6 +198,12 @@ class TIACourseClient(TIAClient):
     def get_list_url(self, limit: int, skip: int):
         return f"{self.base_url}/emne?limit={limit}&skip={skip}"
 
+    def write_objects_data(self, objects_data: List[dict], batch_size: int = 500):
+        courses = super().write_objects_data(objects_data, batch_size)
+        # Courses written in bulk don't send the save signal which updates the search index
+        update_courses_search_index(courses)
+        return courses
+
     def parse_term_code(self, term_code: str) -> [str, int]:
         """
         :param term_code: TIA term code e.g 2004_VÅR
@@ -225,6 +332,13 @@ class TIAFacultyClient(TIAOrganizationUnitClient):
 class TIADepartmentClient(TIAOrganizationUnitClient):
     organization_type = "Institutt"
     model = Department
+    org_units: OrganizationUnitResolver = None
+
+    def get_org_units(self):
+        # Faculties are loaded once per client, instead of queried for every department
+        if self.org_units is None:
+            self.org_units = OrganizationUnitResolver(departments=[])
+        return self.org_units
 
     def resolve_data_for_object(self, organization: dict):
         organization_data = super().resolve_data_for_object(organization)
@@ -233,7 +347,7 @@ class TIADepartmentClient(TIAOrganizationUnitClient):
         department_id = orgreg2_org.get("secNr")
         faculty_id = orgreg2_org.get("facNr")
 
-        faculty = Faculty.objects.filter(faculty_id=faculty_id).first()
+        faculty = self.get_org_units().get_faculty(faculty_id)
 
         organization_data.update(
             {
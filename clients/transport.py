@@ -0,0 +1,126 @@
+import importlib.util
+import weakref
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from .metrics import metrics
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        metrics.increment("http_connections_opened")
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        metrics.increment("http_connections_opened")
+        return super()._new_conn()
+
+
+class TransportAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a default timeout, which counts the requests it sends and the connections it opens.
+    """
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, timeout=None, **kwargs):
+        metrics.increment("http_requests")
+        if timeout is None:
+            timeout = self.timeout
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+class Transport:
+    """
+    Connection pools, retries and timeouts shared by the sessions of every client.
+
+    Sessions mount the same adapters, so requests from any client reuse the kept-alive connections to a host,
+    while cookies and headers stay per session. Hosts in `host_pool_sizes`, given as URL prefixes like
+    https://www.ntnu.no, get a pool of their own size. Requests with a method urllib3 considers idempotent are
+    retried on connection errors and the statuses in `status_forcelist`.
+
+    Connection reuse is counted in the `http_requests` and `http_connections_opened` metrics.
+    """
+
+    def __init__(self, **options):
+        self.sessions = weakref.WeakSet()
+        self.configure(**options)
+
+    def configure(
+        self,
+        pool_size: int = 10,
+        host_pool_sizes: Dict[str, int] = None,
+        retries: int = 3,
+        backoff_factor: float = 0.3,
+        status_forcelist=(500, 502, 504),
+        timeout=(10, 120),
+        http2: bool = False,
+    ):
+        """
+        Replace the adapters of every session using this transport. HTTP/2 can't be turned off again.
+        """
+        self.retry = Retry(
+            total=retries,
+            read=retries,
+            connect=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+        )
+        self.timeout = timeout
+        self.adapter = self.create_adapter(pool_size)
+        self.host_adapters = {
+            prefix: self.create_adapter(host_pool_size)
+            for prefix, host_pool_size in (host_pool_sizes or {}).items()
+        }
+        if http2:
+            self.use_http2()
+
+        for session in list(self.sessions):
+            self.mount(session)
+
+    def create_adapter(self, pool_size: int):
+        return TransportAdapter(
+            timeout=self.timeout,
+            pool_connections=10,
+            pool_maxsize=pool_size,
+            max_retries=self.retry,
+        )
+
+    @staticmethod
+    def use_http2():
+        if importlib.util.find_spec("h2") is None:
+            print("HTTP/2 requires h2, which is not installed. Using HTTP/1.1")
+            return
+        from urllib3.http2 import inject_into_urllib3
+
+        inject_into_urllib3()
+
+    def mount(self, session: requests.Session):
+        session.mount("http://", self.adapter)
+        session.mount("https://", self.adapter)
+        for prefix, adapter in self.host_adapters.items():
+            session.mount(prefix, adapter)
+        self.sessions.add(session)
+        return session
+
+    def create_session(self):
+        return self.mount(requests.Session())
+
+
+# Transport of every client in the current process, see Client.use_transport
+transport = Transport()
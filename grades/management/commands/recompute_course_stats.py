@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from grades.utils import update_courses_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute average grade, pass rate and attendee count for every course"
+
+    def handle(self, *args, **options):
+        updated = update_courses_stats()
+        self.stdout.write(f"Updated stats for {updated} courses")
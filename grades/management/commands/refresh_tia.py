@@ -0,0 +1,46 @@
+import getpass
+import os
+
+from django.core.management.base import BaseCommand
+
+from clients.tia import TIACourseClient, TIADepartmentClient, TIAFacultyClient
+
+CLIENTS = {
+    "faculties": TIAFacultyClient,
+    "departments": TIADepartmentClient,
+    "courses": TIACourseClient,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh every faculty, department or course from the TIA API, logged in with Feide. "
+        "The password is read from TIA_PASSWORD, or prompted for"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "resources",
+            nargs="+",
+            choices=list(CLIENTS),
+            help="Resources to refresh, in order. Departments need their faculties",
+        )
+        parser.add_argument("--username", default=os.environ.get("TIA_USERNAME"))
+        parser.add_argument("--limit", type=int, default=100, help="Objects per page")
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Pages requested at the same time"
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        username = options["username"] or input("Feide username: ")
+        password = os.environ.get("TIA_PASSWORD") or getpass.getpass("Feide password: ")
+
+        for resource in options["resources"]:
+            client = CLIENTS[resource]()
+            client.page_workers = options["workers"]
+            client.login(username=username, password=password)
+            count = client.refresh_all(
+                limit=options["limit"], batch_size=options["batch_size"]
+            )
+            self.stdout.write(f"Refreshed {count} {resource}")
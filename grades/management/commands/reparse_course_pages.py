@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from clients.client import HTML_PARSERS, Client
+from services.reparse_service import ReparseService
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract the course data of every course again from the course pages archived by a sync with "
+        "--archive-dir, without requesting anything. English pages are only archived when the sync fetched "
+        "them, so sections which refer to an English page which was not archived keep their current value, "
+        "until the course is synced again"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive_dir", help="Directory of the page archive")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Number of processes parsing pages, every core by default",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--parser",
+            choices=HTML_PARSERS,
+            help="HTML parser to parse the pages with, html5lib by default",
+        )
+        parser.add_argument(
+            "--course", action="append", dest="codes", help="Only reparse this course"
+        )
+
+    def handle(self, *args, **options):
+        if options["parser"]:
+            Client.use_parser(options["parser"])
+        report = ReparseService(
+            options["archive_dir"],
+            processes=options["processes"],
+            batch_size=options["batch_size"],
+        ).run(options["codes"])
+        self.stdout.write(str(report))
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("grades", "0028_course_pass_rate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="data_fingerprint",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="dbh_fingerprint",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("grades", "0029_course_fingerprints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="last_course_page_year",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="CoursePageMiss",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("course_code", models.CharField(max_length=15, verbose_name="Code")),
+                ("year", models.IntegerField()),
+                (
+                    "checked_date",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "unique_together": {("course_code", "year")},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("grades", "0030_course_page_misses"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="grade",
+            name="digital_exam_checked",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.db.models.functions import Concat
 from django.db.models import ExpressionWrapper, F, Case, When, Value
 from collections import OrderedDict
 from django.urls import reverse
+from django.utils import timezone
 
 
 User = get_user_model()
@@ -58,6 +59,12 @@ class Course(models.Model):
         to="Department", related_name="courses", on_delete=models.SET_NULL, null=True
     )
 
+    # Hashes of the source data from the last sync, used to skip unchanged courses
+    dbh_fingerprint = models.CharField(max_length=64, default="", blank=True)
+    data_fingerprint = models.CharField(max_length=64, default="", blank=True)
+    # Year of the course page the course data was last scraped from, 0 for the current page
+    last_course_page_year = models.IntegerField(default=0)
+
     watson_rank = 0.0
 
     def course_level(self):
@@ -133,6 +140,8 @@ class Grade(models.Model):
 
     average_grade = models.FloatField()
     digital_exam = models.BooleanField(default=False)
+    # Whether digital_exam has been read from the course page of the year, see DigitalExamService
+    digital_exam_checked = models.BooleanField(default=False)
 
     passed = models.IntegerField(default=0)
     a = models.SmallIntegerField(default=0)
@@ -206,6 +215,22 @@ class CourseTag(models.Model):
         )
 
 
+class CoursePageMiss(models.Model):
+    """
+    A year without a course page for a course, so syncs don't probe it again until `checked_date` is stale.
+    """
+
+    course_code = models.CharField("Code", max_length=15)
+    year = models.IntegerField()
+    checked_date = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.course_code} {self.year}"
+
+    class Meta:
+        unique_together = (("course_code", "year"),)
+
+
 class Favourite(models.Model):
     user = models.ForeignKey(
         User, related_name="favourite_courses", on_delete=models.CASCADE
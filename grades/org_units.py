@@ -0,0 +1,69 @@
+from typing import Iterable
+
+from grades.models import Faculty, Department
+
+
+class OrganizationUnitResolver:
+    """
+    Looks up faculties and departments by NSD code or faculty id in memory, without a query per lookup.
+
+    The faculties and departments are loaded once when the resolver is created. Like `.filter().first()`,
+    the first unit in the default ordering wins when several units share a code.
+    """
+
+    institution_code = "1150"
+
+    def __init__(
+        self,
+        faculties: Iterable[Faculty] = None,
+        departments: Iterable[Department] = None,
+    ):
+        if faculties is None:
+            faculties = Faculty.objects.all()
+        if departments is None:
+            departments = Department.objects.all()
+        if hasattr(departments, "select_related"):
+            departments = departments.select_related("faculty")
+
+        self.faculties_by_nsd_code = {}
+        self.faculties_by_id = {}
+        for faculty in faculties:
+            self.faculties_by_nsd_code.setdefault(faculty.nsd_code, faculty)
+            self.faculties_by_id.setdefault(faculty.faculty_id, faculty)
+
+        self.departments_by_nsd_code = {}
+        for department in departments:
+            self.departments_by_nsd_code.setdefault(department.nsd_code, department)
+
+    @classmethod
+    def for_faculty_code(cls, faculty_code: str):
+        """
+        A resolver with only the units of a single DBH `Avdelingskode`, for one-off lookups.
+        """
+        nsd_code = f"{cls.institution_code}{faculty_code}"
+        return cls(
+            Faculty.objects.filter(nsd_code=nsd_code),
+            Department.objects.filter(nsd_code=nsd_code),
+        )
+
+    def get_faculty(self, faculty_id: int):
+        try:
+            return self.faculties_by_id.get(int(faculty_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_faculty_and_department(self, faculty_code: str):
+        """
+        Resolve the DBH `Avdelingskode` of a course to its faculty and department.
+        """
+        if not faculty_code:
+            return None, None
+
+        nsd_code = f"{self.institution_code}{faculty_code}"
+        department = self.departments_by_nsd_code.get(nsd_code)
+        faculty = self.faculties_by_nsd_code.get(nsd_code)
+
+        if department and not faculty:
+            faculty = department.faculty
+
+        return faculty, department
@@ -1,3 +1,8 @@
+from typing import List
+
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from watson import search as watson
 from watson.search import SearchAdapter
 
 from .models import Course
@@ -22,4 +27,21 @@ class CourseSearchAdapter(SearchAdapter):
 
         The default implementation returns `u""`.
         """
-        return f"{' '.join(course.tags.all().values_list('tag', flat=True))}"
+        # Uses prefetched tags when there are any, see update_courses_search_index
+        return " ".join(tag.tag for tag in course.tags.all())
+
+
+def update_courses_search_index(courses: List[Course]):
+    """
+    Update the search entries of courses written in bulk, which don't send the save signal. The courses are
+    added to a search context like saved courses are, so the new entries are created in a single bulk insert.
+    """
+    if not courses:
+        return
+
+    engine = watson.default_search_engine
+    prefetch_related_objects(courses, "tags")
+
+    with transaction.atomic(), watson.update_index():
+        for course in courses:
+            watson.search_context_manager.add_to_context(engine, course)
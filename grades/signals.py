@@ -2,12 +2,13 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 from .models import Grade, Report
-from .utils import update_course_stats, send_report
+from .utils import update_course_stats, send_report, defer_course_stats_update
 
 
 @receiver(post_save, sender=Grade)
 def update_course_stats_from_grade(sender, instance: Grade, **kwargs):
-    update_course_stats(instance.course)
+    if not defer_course_stats_update(instance.course_id):
+        update_course_stats(instance.course)
 
 
 @receiver(post_save, sender=Report)
@@ -5,7 +5,46 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import argparse
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import requests
+
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from watson import search as watson
+
+from clients.corpus import read_corpus
+from clients.page_archive import PageArchive
+from grades.models import (
+    Course,
+    CoursePageMiss,
+    Department,
+    Faculty,
+    Grade,
+    Semester,
+)
+from grades.org_units import OrganizationUnitResolver
+from grades.utils import defer_course_stats, update_course_stats, update_courses_stats
+from scripts import grades_sync
+from scripts.grades_sync import get_shard_arguments, parse_shard
+from services.course_page_probes import CoursePageProbes
+from services.course_service import CourseService
+from services.dbh_index import DBHIndex
+from services.digital_exam_service import DigitalExamService
+from services.reparse_service import ReparseService
+from services.sync_checkpoint import SyncCheckpoint
+from services.sync_service import (
+    CourseSyncTask,
+    SyncReport,
+    SyncService,
+    get_shard,
+)
 
 
 class SimpleTest(TestCase):
@@ -14,3 +53,707 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class CourseStatsTest(TestCase):
+    def setUp(self):
+        self.course = Course.all_objects.create(code="TDT4100", norwegian_name="Test")
+        self.other_course = Course.all_objects.create(
+            code="TDT4110", norwegian_name="Test"
+        )
+
+    def create_grade(self, course, year, **counts):
+        graded = sum(counts.get(letter, 0) for letter in "abcdef")
+        average = (
+            sum(
+                counts.get(letter, 0) * value
+                for letter, value in zip("abcde", [5, 4, 3, 2, 1])
+            )
+            / graded
+            if graded
+            else 0
+        )
+        return Grade.all_objects.create(
+            course=course,
+            year=year,
+            semester=Semester.AUTUMN,
+            average_grade=average,
+            **counts,
+        )
+
+    def test_update_courses_stats_matches_update_course_stats(self):
+        with defer_course_stats():
+            self.create_grade(self.course, 2019, a=10, c=5, f=2)
+            self.create_grade(self.course, 2020, b=3, e=1)
+            self.create_grade(self.course, 2021, passed=20, f=4)
+            self.create_grade(self.other_course, 2021, passed=7)
+
+        update_courses_stats()
+
+        for course in [self.course, self.other_course]:
+            actual = Course.all_objects.get(pk=course.pk)
+            expected = Course.all_objects.get(pk=course.pk)
+            update_course_stats(expected)
+            self.assertAlmostEqual(actual.average, expected.average)
+            self.assertAlmostEqual(actual.pass_rate, expected.pass_rate)
+            self.assertEqual(actual.attendee_count, expected.attendee_count)
+
+    def test_defer_course_stats(self):
+        with defer_course_stats() as course_ids:
+            self.create_grade(self.course, 2019, a=10, f=10)
+            self.assertEqual(
+                Course.all_objects.get(pk=self.course.pk).attendee_count, 0
+            )
+            self.assertEqual(course_ids, {self.course.pk})
+
+        course = Course.all_objects.get(pk=self.course.pk)
+        self.assertEqual(course.attendee_count, 20)
+        self.assertAlmostEqual(course.pass_rate, 50.0)
+        self.assertAlmostEqual(course.average, 2.5)
+
+    def test_course_without_grades(self):
+        update_courses_stats([self.course.pk])
+        course = Course.all_objects.get(pk=self.course.pk)
+        self.assertEqual(course.attendee_count, 0)
+        self.assertEqual(course.average, 0)
+        self.assertEqual(course.pass_rate, 0)
+
+
+class OrganizationUnitResolverTest(TestCase):
+    def setUp(self):
+        self.faculty = Faculty.objects.create(
+            acronym="IE",
+            norwegian_name="Fakultet for informasjonsteknologi og elektroteknikk",
+            organization_unit_id=1,
+            nsd_code="115066",
+            faculty_id=66,
+        )
+        self.department = Department.objects.create(
+            acronym="IDI",
+            norwegian_name="Institutt for datateknologi og informatikk",
+            organization_unit_id=2,
+            nsd_code="115066300",
+            faculty=self.faculty,
+            department_id=30,
+        )
+
+    def test_resolve_without_queries(self):
+        org_units = OrganizationUnitResolver()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                org_units.get_faculty_and_department("66"), (self.faculty, None)
+            )
+            self.assertEqual(
+                org_units.get_faculty_and_department("66300"),
+                (self.faculty, self.department),
+            )
+            self.assertEqual(org_units.get_faculty_and_department("99"), (None, None))
+            self.assertEqual(org_units.get_faculty_and_department(""), (None, None))
+            self.assertEqual(org_units.get_faculty("66"), self.faculty)
+
+    def test_course_service_only_loads_the_units_of_the_code(self):
+        Department.objects.create(
+            acronym="IMF",
+            norwegian_name="Institutt for matematiske fag",
+            organization_unit_id=3,
+            nsd_code="115066200",
+            faculty=self.faculty,
+            department_id=20,
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                CourseService().get_faculty_and_department("66300"),
+                (self.faculty, self.department),
+            )
+
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(all("115066300" in query["sql"] for query in queries))
+
+
+class ReparseServiceTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        pages, _ = read_corpus()
+        archive = PageArchive(self.directory)
+        archive.store("TDT4100", None, "no", pages[("TDT4100", "no")])
+        archive.store("TDT4100", None, "eng", pages[("TDT4100", "eng")])
+        archive.close()
+
+        self.course = Course.all_objects.create(
+            code="TDT4100",
+            norwegian_name="Gammelt navn",
+            taught_from=2015,
+            last_year_taught=2018,
+            data_fingerprint="fingerprint",
+        )
+
+    def test_years_from_dbh_are_kept(self):
+        report = ReparseService(self.directory, processes=1).run()
+
+        self.assertEqual(report.updated, 1)
+        course = Course.all_objects.get(pk=self.course.pk)
+        self.assertEqual(course.norwegian_name, "Objektorientert programmering")
+        self.assertEqual(course.english_name, "Object Oriented Programming")
+        self.assertEqual(course.taught_from, 2015)
+        self.assertEqual(course.last_year_taught, 2018)
+        self.assertEqual(course.data_fingerprint, "")
+
+
+class CourseServiceTest(TestCase):
+    def test_empty_values_do_not_override_existing_fields(self):
+        Course.all_objects.create(
+            code="TDT4100",
+            norwegian_name="Test",
+            english_name="Object-Oriented Programming",
+            content="Innhold",
+            credit=7.5,
+        )
+
+        CourseService().create_or_update_courses_from_data(
+            [
+                {
+                    "code": "TDT4100",
+                    "norwegian_name": "Objektorientert programmering",
+                    "english_name": "",
+                    "content": None,
+                    "credit": 15.0,
+                }
+            ]
+        )
+
+        course = Course.all_objects.get(code="TDT4100")
+        self.assertEqual(course.norwegian_name, "Objektorientert programmering")
+        self.assertEqual(course.english_name, "Object-Oriented Programming")
+        self.assertEqual(course.content, "Innhold")
+        self.assertEqual(course.credit, 15.0)
+
+    def test_courses_are_created_and_updated_in_bulk(self):
+        for code in ["TDT4100", "TDT4110"]:
+            Course.all_objects.create(code=code, norwegian_name="Test")
+        courses_data = [
+            {"code": code, "norwegian_name": f"Nytt navn {code}"}
+            for code in ["TDT4100", "TDT4110", "TMA4100", "TMA4105"]
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            courses = CourseService().create_or_update_courses_from_data(courses_data)
+
+        table = Course._meta.db_table
+        statements = [query["sql"] for query in queries.captured_queries]
+        self.assertEqual(
+            len(
+                [sql for sql in statements if sql.startswith(f'INSERT INTO "{table}"')]
+            ),
+            1,
+        )
+        self.assertEqual(
+            len([sql for sql in statements if sql.startswith(f'UPDATE "{table}"')]), 1
+        )
+        self.assertEqual(sorted(courses), ["TDT4100", "TDT4110", "TMA4100", "TMA4105"])
+        self.assertTrue(all(course.pk for course in courses.values()))
+        self.assertEqual(
+            Course.all_objects.get(code="TMA4105").norwegian_name, "Nytt navn TMA4105"
+        )
+
+    def test_search_index_is_updated(self):
+        Course.all_objects.create(code="TDT4100", norwegian_name="Test")
+
+        courses = CourseService().create_or_update_courses_from_data(
+            [
+                {"code": "TDT4100", "norwegian_name": "Objektorientert programmering"},
+                {"code": "TMA4100", "norwegian_name": "Matematikk 1"},
+            ]
+        )
+
+        self.assertEqual(list(watson.search("Test")), [])
+        for query, code in [
+            ("Objektorientert", "TDT4100"),
+            ("Matematikk", "TMA4100"),
+        ]:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    [entry.object_id_int for entry in watson.search(query)],
+                    [courses[code].pk],
+                )
+
+    def test_course_data_does_not_clear_digital_exam_flag(self):
+        Course.all_objects.create(
+            code="TDT4100", norwegian_name="Test", has_had_digital_exam=True
+        )
+
+        CourseService().create_or_update_courses_from_data(
+            [
+                {
+                    "code": "TDT4100",
+                    "norwegian_name": "Nytt navn",
+                    "has_had_digital_exam": False,
+                }
+            ]
+        )
+
+        course = Course.all_objects.get(code="TDT4100")
+        self.assertEqual(course.norwegian_name, "Nytt navn")
+        self.assertTrue(course.has_had_digital_exam)
+
+
+class SyncCheckpointTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def get_file_names(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_resume_continues_the_last_run(self):
+        checkpoint = SyncCheckpoint.start(self.directory)
+        checkpoint.mark("TDT4100", SyncCheckpoint.SKIPPED)
+        checkpoint.mark("TDT4110", SyncCheckpoint.FAILED)
+        checkpoint.commit(["TMA4100"])
+
+        resumed = SyncCheckpoint.resume(self.directory)
+
+        self.assertEqual(resumed.run_id, checkpoint.run_id)
+        self.assertEqual(resumed.last_course_code, "TMA4100")
+        self.assertTrue(resumed.is_done("TDT4100"))
+        self.assertFalse(resumed.is_done("TDT4110"))
+        self.assertTrue(resumed.is_done("TMA4100"))
+        self.assertFalse(resumed.is_done("TFY4125"))
+
+    def test_resume_after_finished_run_starts_a_new_run(self):
+        checkpoint = SyncCheckpoint.start(self.directory)
+        checkpoint.save_table("grades", [{"Emnekode": "TDT4100-1"}])
+        checkpoint.commit(["TDT4100"])
+        checkpoint.finish()
+
+        resumed = SyncCheckpoint.resume(self.directory)
+
+        self.assertNotEqual(resumed.run_id, checkpoint.run_id)
+        self.assertIsNone(resumed.finished_at)
+        self.assertFalse(resumed.is_done("TDT4100"))
+        self.assertFalse(resumed.has_table("grades"))
+
+    def test_start_of_whole_sync_discards_tables_and_shards(self):
+        checkpoint = SyncCheckpoint.start(self.directory)
+        checkpoint.save_table("grades", [{"Emnekode": "TDT4100-1"}])
+        SyncCheckpoint.start(self.directory, SyncCheckpoint.get_shard_name(0, 2))
+
+        SyncCheckpoint.start(self.directory)
+
+        self.assertEqual(self.get_file_names(), ["checkpoint.json"])
+
+    def test_start_of_shard_keeps_tables_and_other_shards(self):
+        checkpoint = SyncCheckpoint.start(self.directory)
+        checkpoint.save_table("grades", [{"Emnekode": "TDT4100-1"}])
+        first_shard = SyncCheckpoint.start(
+            self.directory, SyncCheckpoint.get_shard_name(0, 2)
+        )
+        first_shard.commit(["TDT4100"])
+        SyncCheckpoint.start(self.directory, SyncCheckpoint.get_shard_name(1, 2))
+
+        SyncCheckpoint.start(self.directory, SyncCheckpoint.get_shard_name(0, 2))
+
+        self.assertEqual(
+            self.get_file_names(),
+            [
+                "checkpoint-0-of-2.json",
+                "checkpoint-1-of-2.json",
+                "checkpoint.json",
+                "grades.json.gz",
+            ],
+        )
+        resumed = SyncCheckpoint.resume(
+            self.directory, SyncCheckpoint.get_shard_name(0, 2)
+        )
+        self.assertFalse(resumed.is_done("TDT4100"))
+        self.assertEqual(
+            [dict(row) for row in resumed.load_table("grades")],
+            [{"Emnekode": "TDT4100-1"}],
+        )
+
+
+def build_grade_row(code: str, year: int, letter: str, count: int):
+    return {
+        "Emnekode": f"{code}-1",
+        "Årstall": str(year),
+        "Semester": "1",
+        "Karakter": letter,
+        "Antall kandidater totalt": str(count),
+    }
+
+
+def build_course_row(code: str, year: int, name: str):
+    return {
+        "Emnekode": f"{code}-1",
+        "Årstall": str(year),
+        "Status": "1",
+        "Emnenavn": name,
+        "Avdelingskode": "",
+    }
+
+
+class SyncServiceTest(TestCase):
+    def setUp(self):
+        self.grades = [
+            build_grade_row("TDT4100", 2020, "A", 10),
+            build_grade_row("TMA4100", 2020, "B", 5),
+        ]
+        self.courses = [
+            build_course_row("TDT4100", 2020, "Objektorientert programmering"),
+            build_course_row("TMA4100", 2020, "Matematikk 1"),
+        ]
+
+    def test_failed_fetchers_fail_the_sync(self):
+        service = SyncService(workers=2)
+        with mock.patch.object(
+            service, "fetch_course_data", side_effect=ValueError("Crashed")
+        ):
+            with self.assertRaises(RuntimeError) as context:
+                service.sync(self.grades, self.courses)
+
+        self.assertIsInstance(context.exception.__cause__, ValueError)
+        self.assertIsNone(service.course_service.course_page_probes)
+        self.assertIsNone(service.course_service.english_names)
+
+    def test_stopped_fetchers_fail_the_sync(self):
+        service = SyncService(workers=2)
+        service.result_poll_interval = 0.01
+        with mock.patch.object(service, "fetch_course_data", return_value=None):
+            with self.assertRaises(RuntimeError):
+                service.sync(self.grades, self.courses)
+
+    def create_synced_courses(self, dbh_index: DBHIndex):
+        Course.all_objects.create(
+            code="TDT4100",
+            norwegian_name="Test",
+            dbh_fingerprint=SyncService.get_dbh_fingerprint("TDT4100", dbh_index),
+        )
+        Course.all_objects.create(
+            code="TMA4100", norwegian_name="Test", dbh_fingerprint="changed"
+        )
+
+    def test_courses_with_unchanged_dbh_rows_are_skipped(self):
+        dbh_index = DBHIndex(self.courses, self.grades)
+        self.create_synced_courses(dbh_index)
+        service = SyncService()
+        service.synced_courses = service.get_synced_courses()
+        report = SyncReport()
+
+        tasks = service.get_tasks(dbh_index, report)
+
+        self.assertEqual([task.code for task in tasks], ["TMA4100"])
+        self.assertEqual(
+            tasks[0].dbh_fingerprint,
+            SyncService.get_dbh_fingerprint("TMA4100", dbh_index),
+        )
+        self.assertEqual(report.unchanged, 1)
+
+    def test_dbh_fingerprint_does_not_depend_on_row_order(self):
+        grades = [
+            build_grade_row("TDT4100", 2020, "A", 10),
+            build_grade_row("TDT4100", 2020, "B", 5),
+            build_grade_row("TDT4100", 2021, "A", 8),
+        ]
+
+        self.assertEqual(
+            SyncService.get_dbh_fingerprint(
+                "TDT4100", DBHIndex(self.courses, grades[::-1])
+            ),
+            SyncService.get_dbh_fingerprint("TDT4100", DBHIndex(self.courses, grades)),
+        )
+
+    def test_full_sync_syncs_unchanged_courses(self):
+        dbh_index = DBHIndex(self.courses, self.grades)
+        self.create_synced_courses(dbh_index)
+        service = SyncService(full=True)
+        service.synced_courses = service.get_synced_courses()
+        report = SyncReport()
+
+        tasks = service.get_tasks(dbh_index, report)
+
+        self.assertEqual([task.code for task in tasks], ["TDT4100", "TMA4100"])
+        self.assertEqual(report.unchanged, 0)
+
+    def test_failed_batch_is_written_course_by_course(self):
+        service = SyncService()
+        service.course_service.course_page_probes = CoursePageProbes()
+        tasks = []
+        for code, name in [("TDT4100", "Objektorientert programmering"), ("BAD", None)]:
+            task = CourseSyncTask(code, [build_grade_row(code, 2020, "A", 10)], "")
+            task.course_data = {"code": code, "norwegian_name": name}
+            tasks.append(task)
+        report = SyncReport()
+
+        service.write_courses(tasks, report)
+
+        self.assertEqual((report.created, report.failed), (1, 1))
+        self.assertEqual(
+            list(Course.all_objects.values_list("code", flat=True)), ["TDT4100"]
+        )
+        self.assertEqual(Grade.all_objects.filter(course__code="TDT4100").count(), 1)
+
+    def test_partial_sync_keeps_dbh_fingerprints(self):
+        Course.all_objects.create(
+            code="TDT4100", norwegian_name="Test", dbh_fingerprint="full"
+        )
+        service = SyncService(partial=True)
+        service.synced_courses = service.get_synced_courses()
+
+        tasks = service.get_tasks(DBHIndex(self.courses, self.grades), SyncReport())
+
+        self.assertEqual(
+            {task.code: task.dbh_fingerprint for task in tasks},
+            {"TDT4100": "full", "TMA4100": ""},
+        )
+
+    def test_throttle_is_not_shared_with_other_course_services(self):
+        service = SyncService()
+
+        self.assertIs(
+            service.course_service.course_page_client.throttle, service.throttle
+        )
+        self.assertIsNone(CourseService.course_page_client.throttle)
+        self.assertIsNone(CourseService().course_client.throttle)
+
+
+class CoursePageProbesTest(TestCase):
+    def setUp(self):
+        Course.all_objects.create(
+            code="TDT4100", norwegian_name="Test", last_course_page_year=2019
+        )
+        CoursePageMiss.objects.create(course_code="TDT4100", year=2023)
+        CoursePageMiss.objects.create(
+            course_code="TDT4100",
+            year=2022,
+            checked_date=timezone.now() - CoursePageProbes.miss_ttl * 2,
+        )
+
+    def test_last_page_year_first_without_recent_misses(self):
+        probes = CoursePageProbes()
+
+        self.assertEqual(
+            probes.get_years("TDT4100", [2024, 2023, 2022, 2021]),
+            [2019, 2024, 2022, 2021],
+        )
+        self.assertEqual(probes.get_years("TMA4100", [2024, 2023]), [2024, 2023])
+
+    def test_years_are_limited_to_the_years_given(self):
+        probes = CoursePageProbes(["TDT4100"])
+
+        self.assertEqual(probes.get_years("TDT4100", [2024, 2022]), [2019, 2024])
+
+    def test_hits_and_misses_are_used_by_later_probes(self):
+        probes = CoursePageProbes()
+        probes.add_miss("TMA4100", 2024)
+        probes.add_hit("TMA4100", 2021)
+
+        self.assertEqual(
+            probes.get_years("TMA4100", [2024, 2023, 2022]), [2021, 2023, 2022]
+        )
+
+    def test_misses_of_rolled_back_save_are_saved_again(self):
+        probes = CoursePageProbes()
+        probes.add_miss("TMA4100", 2024)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    probes.save()
+                    raise ValueError("Failed batch")
+        self.assertFalse(CoursePageMiss.objects.filter(course_code="TMA4100").exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            probes.save()
+        self.assertTrue(
+            CoursePageMiss.objects.filter(course_code="TMA4100", year=2024).exists()
+        )
+        self.assertEqual(probes.new_misses, set())
+
+
+class ShardTest(SimpleTestCase):
+    def test_shards_are_the_same_in_every_process(self):
+        # From crc32, unlike hash(), which is salted per process
+        self.assertEqual(
+            [get_shard(code, 3) for code in ["TDT4100", "TMA4100", "TFY4125"]],
+            [0, 1, 0],
+        )
+
+    def test_every_course_is_synced_by_one_shard(self):
+        codes = [f"TST{number}" for number in range(20)]
+        dbh_index = DBHIndex(
+            [build_course_row(code, 2020, "Test") for code in codes],
+            [build_grade_row(code, 2020, "A", 10) for code in codes],
+        )
+
+        shard_codes = []
+        for shard_index in range(3):
+            service = SyncService(shard=(shard_index, 3))
+            tasks = service.get_tasks(dbh_index, SyncReport())
+            shard_codes.append({task.code for task in tasks})
+
+        self.assertTrue(all(shard_codes))
+        self.assertEqual(sum(len(shard) for shard in shard_codes), len(codes))
+        self.assertEqual(set().union(*shard_codes), set(codes))
+
+    def test_shard_processes_get_the_arguments_of_the_run(self):
+        arguments = argparse.Namespace(processes=2, metrics_file="metrics.json")
+        argv = [
+            "grades_sync.py",
+            "--processes",
+            "2",
+            "--metrics-file=metrics.json",
+            "--workers",
+            "4",
+        ]
+        with mock.patch.object(sys, "argv", argv):
+            shard_arguments = get_shard_arguments(arguments, 1)
+
+        self.assertEqual(
+            shard_arguments,
+            ["--shard", "1/2", "--metrics-file", "metrics.json.1", "--workers", "4"],
+        )
+
+    def test_resume_after_finished_sharded_run_downloads_the_tables(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        argv = ["grades_sync.py", "--processes", "2", "--state-dir", directory.name]
+
+        for run, code in enumerate(["TDT4100", "TMA4100"]):
+            get_all_grades = mock.Mock(return_value=[{"Emnekode": f"{code}-1"}])
+            with (
+                mock.patch.object(sys, "argv", argv + ["--resume"] * run),
+                mock.patch.object(grades_sync, "Client"),
+                mock.patch.object(grades_sync, "run_shards") as run_shards,
+                mock.patch.object(
+                    grades_sync.NSDGradeClient, "get_all_grades", get_all_grades
+                ),
+                mock.patch.object(
+                    grades_sync.NSDCourseClient, "get_all_courses", return_value=[]
+                ),
+            ):
+                grades_sync.main()
+
+            run_shards.assert_called_once()
+            get_all_grades.assert_called_once()
+
+        self.assertEqual(
+            [dict(row) for row in SyncCheckpoint(directory.name).load_table("grades")],
+            [{"Emnekode": "TMA4100-1"}],
+        )
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("1/4"), (1, 4))
+        for value in ["4/4", "1", "a/4"]:
+            with self.subTest(value=value):
+                with self.assertRaises(argparse.ArgumentTypeError):
+                    parse_shard(value)
+
+
+class DigitalExamServiceTest(TestCase):
+    def setUp(self):
+        self.course = Course.all_objects.create(code="TDT4100", norwegian_name="Test")
+        self.other_course = Course.all_objects.create(
+            code="TMA4100", norwegian_name="Test", has_had_digital_exam=True
+        )
+        self.current_year = timezone.now().year
+
+    def create_grade(self, course, year: int, semester: str, **fields):
+        return Grade.all_objects.create(
+            course=course,
+            year=year,
+            semester=semester,
+            average_grade=3.0,
+            a=1,
+            **fields,
+        )
+
+    def test_grades_are_grouped_by_the_study_year_of_their_page(self):
+        autumn = self.create_grade(self.course, 2020, Semester.AUTUMN)
+        spring = self.create_grade(self.course, 2021, Semester.SPRING)
+        summer = self.create_grade(self.course, 2021, Semester.SUMMER)
+        self.create_grade(self.course, 2021, Semester.AUTUMN, digital_exam_checked=True)
+        other = self.create_grade(self.other_course, 2020, Semester.AUTUMN)
+
+        pages = DigitalExamService().get_pages()
+
+        self.assertEqual(
+            dict(pages),
+            {
+                ("TDT4100", 2020): [
+                    (autumn.id, self.course.id, Semester.AUTUMN),
+                    (spring.id, self.course.id, Semester.SPRING),
+                    (summer.id, self.course.id, Semester.SUMMER),
+                ],
+                ("TMA4100", 2020): [(other.id, self.other_course.id, Semester.AUTUMN)],
+            },
+        )
+        self.assertEqual(
+            list(
+                DigitalExamService().get_pages(include=lambda code: code == "TMA4100")
+            ),
+            [("TMA4100", 2020)],
+        )
+
+    def test_write(self):
+        old_year = self.current_year - 3
+        recent_year = self.current_year - 1
+        digital = self.create_grade(self.course, old_year, Semester.AUTUMN)
+        not_digital = self.create_grade(self.other_course, old_year, Semester.AUTUMN)
+        old_without_table = self.create_grade(
+            self.course, old_year - 1, Semester.AUTUMN
+        )
+        recent_without_table = self.create_grade(
+            self.course, recent_year, Semester.AUTUMN
+        )
+        not_fetched = self.create_grade(self.course, old_year - 2, Semester.AUTUMN)
+        service = DigitalExamService()
+        pages = service.get_pages()
+
+        checked = service.write(
+            pages,
+            {
+                ("TDT4100", old_year): {"Høst": True},
+                ("TMA4100", old_year): {"Høst": False},
+                ("TDT4100", old_year - 1): {},
+                ("TDT4100", recent_year): {},
+                ("TDT4100", old_year - 2): None,
+            },
+        )
+
+        self.assertEqual(checked, 3)
+        for grade, digital_exam, digital_exam_checked in [
+            (digital, True, True),
+            (not_digital, False, True),
+            (old_without_table, False, True),
+            (recent_without_table, False, False),
+            (not_fetched, False, False),
+        ]:
+            grade.refresh_from_db()
+            self.assertEqual(
+                (grade.digital_exam, grade.digital_exam_checked),
+                (digital_exam, digital_exam_checked),
+            )
+        self.course.refresh_from_db()
+        self.other_course.refresh_from_db()
+        self.assertTrue(self.course.has_had_digital_exam)
+        # Only ever set, also when the exams of a page were not digital
+        self.assertTrue(self.other_course.has_had_digital_exam)
+
+    def test_pages_with_error_responses_are_not_checked(self):
+        response = requests.Response()
+        response.status_code = 429
+        response._content = b"<html><body>Too many requests</body></html>"
+        service = DigitalExamService()
+        pages = {("TDT4100", 2015): []}
+
+        with mock.patch(
+            "clients.course_pages.CoursePagesClient.request", return_value=response
+        ):
+            exam_terms = service.fetch_exam_terms(pages)
+
+        self.assertEqual(exam_terms, {("TDT4100", 2015): None})
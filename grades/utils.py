@@ -1,9 +1,15 @@
-from typing import List
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
 
 from .models import Course, Report, Grade
 
+_deferred_course_stats = threading.local()
+
 
 def calculate_average_grade(grades: List[Grade]):
     average = 0
@@ -54,6 +60,69 @@ def update_course_stats(course: Course):
     course.save()
 
 
+def get_course_stats_subquery(expression):
+    grades = Grade._base_manager.filter(course_id=OuterRef("pk")).order_by()
+    return Subquery(
+        grades.values("course_id").annotate(total=Sum(expression)).values("total")
+    )
+
+
+def update_courses_stats(course_ids: Iterable[int] = None):
+    """
+    Recompute the same stats as update_course_stats in a single UPDATE, for the given courses or every course.
+    """
+    graded = F("a") + F("b") + F("c") + F("d") + F("e") + F("f")
+    graded_attendees = get_course_stats_subquery(graded)
+    grade_sum = get_course_stats_subquery(F("average_grade") * graded)
+    attendees = get_course_stats_subquery(graded + F("passed"))
+    failed = get_course_stats_subquery(F("f"))
+
+    courses = Course.all_objects.all()
+    if course_ids is not None:
+        courses = courses.filter(id__in=course_ids)
+
+    return courses.update(
+        average=Coalesce(grade_sum / NullIf(graded_attendees, 0), Value(0.0)),
+        pass_rate=Coalesce(
+            (attendees - failed) * Value(100.0) / NullIf(attendees, 0), Value(0.0)
+        ),
+        attendee_count=Coalesce(attendees, 0),
+    )
+
+
+@contextmanager
+def defer_course_stats():
+    """
+    Don't recompute course stats while grades are saved in this context.
+    The stats of the affected courses are recomputed together when the outermost context exits without errors.
+    """
+    if getattr(_deferred_course_stats, "course_ids", None) is not None:
+        yield _deferred_course_stats.course_ids
+        return
+
+    _deferred_course_stats.course_ids = set()
+    try:
+        yield _deferred_course_stats.course_ids
+        course_ids = _deferred_course_stats.course_ids
+    finally:
+        _deferred_course_stats.course_ids = None
+
+    if course_ids:
+        update_courses_stats(course_ids)
+
+
+def defer_course_stats_update(*course_ids: int):
+    """
+    Mark course stats for recomputation if inside defer_course_stats, returns False if they should be updated now.
+    """
+    deferred_course_ids = getattr(_deferred_course_stats, "course_ids", None)
+    if deferred_course_ids is None:
+        return False
+
+    deferred_course_ids.update(course_ids)
+    return True
+
+
 def send_report(report: Report):
     send_mail(
         subject=report.subject,
@@ -192,6 +192,10 @@ class TIAObjectListRefreshSerializer(serializers.Serializer):
     password = serializers.CharField()
     limit = serializers.IntegerField(default=100)
     skip = serializers.IntegerField(default=0)
+    all = serializers.BooleanField(
+        default=False,
+        help_text="Refresh every page of `limit` objects, instead of the page at `skip`",
+    )
 
     class Meta:
         fields = (
@@ -199,6 +203,7 @@ class TIAObjectListRefreshSerializer(serializers.Serializer):
             "password",
             "limit",
             "skip",
+            "all",
         )
 
 
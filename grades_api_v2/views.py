@@ -210,6 +210,10 @@ class TIAScraperViewSet(viewsets.GenericViewSet):
             username=data.get("username"),
             password=data.get("password"),
         )
+        if data.get("all"):
+            count = client.refresh_all(limit=data.get("limit"))
+            return Response(status=status.HTTP_200_OK, data={"refreshed": count})
+
         objects = client.refresh_objects(
             limit=data.get("limit"),
             skip=data.get("skip"),
@@ -2,36 +2,20 @@ import sys
 from typing import Optional, List, Dict
 import time
 
-import requests
 import bs4
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-
-s = requests.Session()
-
-
-def requests_retry_session(
-    retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 504), session=None
-):
-    session = session or requests.Session()
-    retry = Retry(
-        total=retries,
-        read=retries,
-        connect=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=status_forcelist,
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
+
+from clients.client import Client
+from clients.course_pages import CoursePagesClient
+
+# Retries and keeps connections alive with the transport shared by the clients
+s = Client.transport.create_session()
+course_pages_client = CoursePagesClient()
+
+TERMS = {"Vår": "Spring", "Høst": "Fall", "Sommer": "Summer"}
 
 
 URL_FORMAT_STRING = "https://www.ntnu.no/studier/emner/{}#tab=omEksamen"
 URL_COURSE_YEAR_FORMAT_STRING = "https://www.ntnu.no/studier/emner/{}/{}#tab=omEksamen"
-HTML_PARSER = (
-    "html5lib"  # "html5lib" is external dependency, "html.parser" is python built-in
-)
 headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 6.0; WOW64; rv:24.0) Gecko/20100101 Firefox/24.0"
 }
@@ -47,12 +31,12 @@ def retrieve_exam_years(course_code: str) -> List[str]:
     :return: a list of (university) years
     """
     course_url = URL_FORMAT_STRING.format(course_code)
-    response = requests_retry_session(session=s).get(course_url)
+    response = s.get(course_url)
     if response.status_code != 200:
         warn(
             f"WARN: Response was not 200! For course {course_code}, was {response.status_code}"
         )
-    soup = bs4.BeautifulSoup(response.text, HTML_PARSER)
+    soup = bs4.BeautifulSoup(response.text, Client.html_parser)
     select_tag_exam_year: Optional[bs4.element.Tag] = soup.find(
         attrs={"id": "selectedYear"}
     )
@@ -86,36 +70,22 @@ def retrieve_exam_type_of_years(
 
     for year in years:
         url = URL_COURSE_YEAR_FORMAT_STRING.format(course_code, year)
-        response = requests_retry_session(session=s).get(url)
-        soup = bs4.BeautifulSoup(response.text, HTML_PARSER)
+        response = s.get(url)
+        soup = bs4.BeautifulSoup(response.text, Client.html_parser)
         om_eksamen: Optional[bs4.element.Tag] = soup.find(attrs={"id": "omEksamen"})
         if om_eksamen is None:
             warn(f"Couldn't find omEksamen for {course_code} year {year}")
             continue
-        dl: Optional[bs4.element.Tag] = om_eksamen.find("dl")
-        if dl is None:
+        if om_eksamen.find("dl") is None:
             warn(f"omEksamen tag for {course_code} year {year} had no dl tag, skipping")
             continue
-        term_is_digital_dict: Dict[str, bool] = dict()
-        for dt in dl.find_all("dt"):
-            term: Optional[bs4.element.Tag] = dt.find(class_="exam-term")
-            if term is None:
-                continue
-
-            system: Optional[bs4.element.Tag] = dt.find(class_="exam-system")
-            # exam_status: Optional[bs4.element.Tag] = dt.find(class_="exam-code")
-
-            term_std = ""
-            term_txt = term.text.strip()
-            if term_txt == "Vår":
-                term_std = "Spring"
-            elif term_txt == "Høst":
-                term_std = "Fall"
-            elif term_txt == "Sommer":
-                term_std = "Summer"
-            else:
-                continue
-            term_is_digital_dict[term_std] = system.text.strip() == "INSPERA"
+        term_is_digital_dict: Dict[str, bool] = {
+            TERMS[term]: is_digital
+            for term, is_digital in course_pages_client.extract_exam_terms(
+                om_eksamen
+            ).items()
+            if term in TERMS
+        }
         result[year] = term_is_digital_dict
         # sleep a little bit to avoid hammering the website
         time.sleep(sleep_time_mean_ms)
@@ -1,62 +1,297 @@
 # -*- coding: utf-8 -*-
 
+import argparse
 import os
+from datetime import datetime
+import subprocess
+import sys
 import django
-import requests
-from operator import itemgetter
-from itertools import groupby
-import re
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gradestats.settings")
 django.setup()
 
-from services.course_service import CourseService  # noqa: E402
-from services.grade_service import GradeService  # noqa: E402
+from services.sync_checkpoint import SyncCheckpoint  # noqa: E402
+from services.sync_service import SyncService  # noqa: E402
 
 from grades.models import Faculty, Department  # noqa: E402
-from clients.nsd import NSDGradeClient, NSDCourseClient  # noqa: E402
+from clients.client import FALLBACK_HTML_PARSER, HTML_PARSERS, Client  # noqa: E402
+from clients.course_pages import CoursePagesClient  # noqa: E402
+from clients.metrics import metrics  # noqa: E402
+from clients.nsd import NSDClient, NSDGradeClient, NSDCourseClient  # noqa: E402
 
-session = requests.session()
 
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Sync courses and grades from DBH")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of courses fetched concurrently",
+    )
+    parser.add_argument(
+        "--per-host-limit",
+        type=int,
+        default=4,
+        help="Max concurrent requests to a single host",
+    )
+    parser.add_argument(
+        "--per-host-interval",
+        type=float,
+        default=0.0,
+        help="Min seconds between starting two requests to the same host",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="Max requests per second to a single host, on average",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50,
+        help="Number of courses written to the database at once",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Sync every course, also those with unchanged DBH data since the last sync",
+    )
+    parser.add_argument(
+        "--chunked",
+        action="store_true",
+        help="Download the DBH tables in a query per year, fetched in parallel and retried separately",
+    )
+    parser.add_argument(
+        "--from-year",
+        type=int,
+        help="Only download and sync grades from this year on, in a query per year. Every course is "
+        "synced, since the rows of some years can't be compared with those of the last sync",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Cache DBH and course page responses in this directory",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use responses from --cache-dir, without any network requests",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        help="Archive the fetched course pages in this directory, to reparse them with "
+        "manage.py reparse_course_pages",
+    )
+    parser.add_argument(
+        "--state-dir",
+        default=".sync-state",
+        help="Directory for the checkpoint and the downloaded DBH tables of the sync",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last sync from its checkpoint, with the DBH tables it downloaded",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Only sync shard i of N of the courses, given as i/N, e.g. 0/4. Uses the DBH tables in --state-dir "
+        "when they have been downloaded, e.g. with --download-only",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Download the DBH tables once, and sync them in this many shards in parallel processes",
+    )
+    parser.add_argument(
+        "--download-only",
+        action="store_true",
+        help="Only download the DBH tables to --state-dir, for shards to sync",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=HTML_PARSERS,
+        default=FALLBACK_HTML_PARSER,
+        help="Parse course pages with this parser, html5lib is used when it is not installed. "
+        "Other parsers than html5lib only parse the parts of the pages course data is read from",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=120.0,
+        help="Seconds to wait for a response to start or continue before failing the request",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="Use HTTP/2 for HTTPS requests, when h2 is installed (experimental in urllib3)",
+    )
+    parser.add_argument(
+        "--digital-exams",
+        action="store_true",
+        help="Also check the course pages for digital exams of grades not checked before",
+    )
+    parser.add_argument(
+        "--dbh-url",
+        help="Query the DBH API at this URL instead of dbh.hkdir.no, e.g. benchmarks/standin_server.py",
+    )
+    parser.add_argument(
+        "--course-pages-url",
+        help="Fetch course pages from this URL instead of ntnu.no and ntnu.edu, e.g. benchmarks/standin_server.py",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="Also write the JSON summary of stage timings and counters to this file",
+    )
+    return parser.parse_args()
 
-def validate_course_code(code):
-    return re.match(r"^[a-zA-Z0-9-_\sæøåÆØÅ]+$", code)
+
+def parse_shard(value: str):
+    try:
+        shard_index, shard_count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard {value}, expected i/N")
+    if not 0 <= shard_index < shard_count:
+        raise argparse.ArgumentTypeError(f"Invalid shard {value}, expected 0 <= i < N")
+    return shard_index, shard_count
+
+
+def get_shard_arguments(arguments, shard_index: int):
+    """
+    The arguments of this run for a process syncing a single shard. Each shard writes its own metrics file.
+    """
+    shard_count = arguments.processes
+    shard_arguments = ["--shard", f"{shard_index}/{shard_count}"]
+    if arguments.metrics_file:
+        shard_arguments += ["--metrics-file", f"{arguments.metrics_file}.{shard_index}"]
+
+    skip_value = False
+    for argument in sys.argv[1:]:
+        if skip_value:
+            skip_value = False
+        elif argument in {"--processes", "--metrics-file"}:
+            skip_value = True
+        elif not argument.startswith(("--processes=", "--metrics-file=")):
+            shard_arguments.append(argument)
+    return shard_arguments
+
+
+def run_shards(arguments):
+    processes = [
+        subprocess.Popen(
+            [sys.executable, __file__] + get_shard_arguments(arguments, shard_index)
+        )
+        for shard_index in range(arguments.processes)
+    ]
+    failed = [
+        str(shard_index)
+        for shard_index, process in enumerate(processes)
+        if process.wait() != 0
+    ]
+    if failed:
+        raise SystemExit(f"Failed to sync shards {', '.join(failed)}")
+
+
+def get_table(checkpoint: SyncCheckpoint, name: str, fetch):
+    if checkpoint.has_table(name):
+        print(f"Using {name} downloaded in sync {checkpoint.run_id}")
+        return checkpoint.load_table(name)
+
+    rows = list(fetch())
+    checkpoint.save_table(name, rows)
+    return rows
 
 
 def main():
-    course_service = CourseService()
-    grade_service = GradeService()
+    arguments = get_arguments()
+    metrics.reset()
+
+    if arguments.offline and not arguments.cache_dir:
+        raise SystemExit("--offline requires --cache-dir")
+    if arguments.cache_dir:
+        Client.use_cache(arguments.cache_dir, replay_only=arguments.offline)
+    if arguments.archive_dir:
+        CoursePagesClient.use_archive(arguments.archive_dir)
+
+    Client.use_parser(arguments.parser)
+    # Enough kept-alive connections for the concurrent requests to a single host
+    Client.use_transport(
+        pool_size=max(arguments.per_host_limit, NSDClient.chunk_workers),
+        timeout=(10, arguments.timeout),
+        http2=arguments.http2,
+    )
+    if arguments.dbh_url:
+        NSDClient.base_url = arguments.dbh_url
+    if arguments.course_pages_url:
+        CoursePagesClient.base_url_no = f"{arguments.course_pages_url}/studier/emner"
+        CoursePagesClient.base_url_eng = f"{arguments.course_pages_url}/studies/courses"
+
+    if arguments.shard and arguments.processes > 1:
+        raise SystemExit("--shard can't be combined with --processes")
+
+    checkpoint_name = SyncCheckpoint.default_name
+    if arguments.shard:
+        checkpoint_name = SyncCheckpoint.get_shard_name(*arguments.shard)
+    if arguments.resume:
+        checkpoint = SyncCheckpoint.resume(arguments.state_dir, checkpoint_name)
+    else:
+        checkpoint = SyncCheckpoint.start(arguments.state_dir, checkpoint_name)
+    print(f"Sync {checkpoint.run_id}")
+
+    sync_service = SyncService(
+        workers=arguments.workers,
+        per_host_limit=arguments.per_host_limit,
+        per_host_interval=arguments.per_host_interval,
+        batch_size=arguments.batch_size,
+        full=arguments.full,
+        partial=bool(arguments.from_year),
+        rate=arguments.rate,
+        checkpoint=checkpoint,
+        shard=arguments.shard,
+        digital_exams=arguments.digital_exams,
+    )
     nsd_grade_client = NSDGradeClient()
     nsd_course_client = NSDCourseClient()
 
     faculties = Faculty.objects.all()
     departments = Department.objects.all()
 
-    grades = nsd_grade_client.get_all_grades()
-    courses = nsd_course_client.get_all_courses()
+    years = None
+    if arguments.chunked:
+        years = range(NSDClient.first_year, datetime.now().year + 1)
+    grade_years = years
+    if arguments.from_year:
+        grade_years = range(arguments.from_year, datetime.now().year + 1)
 
-    for course_code, course_grades in groupby(grades, key=itemgetter("Emnekode")):
-        # Don't sync courses with special-character codes
-        if not validate_course_code(course_code):
-            print(f"Course {course_code} has invalid code. Skipping")
-            continue
-
-        print(f"Syncing course {course_code}")
-
-        course_grades = list(course_grades)
-        course_code = course_code.rsplit("-", 1)[0]
-
-        course_data = course_service.get_course_data(
-            course_code, courses, course_grades, faculties, departments
-        )
+    grades = get_table(
+        checkpoint,
+        "grades",
+        lambda: nsd_grade_client.get_all_grades(stream=True, years=grade_years),
+    )
+    courses = get_table(
+        checkpoint,
+        "courses",
+        lambda: nsd_course_client.get_all_courses(stream=True, years=years),
+    )
 
-        if not course_data:
-            print(f"Skipping course {course_code}")
-            continue
+    if arguments.download_only:
+        return
+    if arguments.processes > 1:
+        # The shards load the DBH tables downloaded above
+        del grades, courses
+        run_shards(arguments)
+        # Every shard succeeded, so the next run downloads the DBH tables again, even with --resume
+        checkpoint.finish()
+        return
 
-        course_service.create_or_update_course_from_data(course_data)
+    report = sync_service.sync(grades, courses, faculties, departments)
+    print(report)
 
-        grade_service.create_or_update_grades_for_course(course_code, course_grades)
+    summary = metrics.to_json(run_id=checkpoint.run_id, report=report.as_dict())
+    print(summary)
+    if arguments.metrics_file:
+        with open(arguments.metrics_file, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(summary)
 
 
 if __name__ == "__main__":
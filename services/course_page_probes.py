@@ -0,0 +1,86 @@
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from typing import Iterable, List
+
+from django.db import transaction
+from django.utils import timezone
+
+from grades.models import Course, CoursePageMiss
+
+
+class CoursePageProbes:
+    """
+    Decides which years to probe the course pages of a course for, from the years which recently had no page
+    and the last year which had one.
+
+    The misses and hits are loaded when created, for every course or only for `codes`. New misses are kept
+    in memory until `save` is committed, so threads probing course pages don't write to the database, and
+    misses saved in a transaction which is rolled back are saved again by the next `save`.
+    """
+
+    miss_ttl = timedelta(days=30)
+
+    def __init__(self, codes: Iterable[str] = None):
+        misses = CoursePageMiss.objects.filter(
+            checked_date__gte=timezone.now() - self.miss_ttl
+        )
+        courses = Course.all_objects.filter(last_course_page_year__gt=0)
+        if codes is not None:
+            codes = list(codes)
+            misses = misses.filter(course_code__in=codes)
+            courses = courses.filter(code__in=codes)
+
+        self.missed_years = defaultdict(set)
+        for course_code, year in misses.values_list("course_code", "year"):
+            self.missed_years[course_code].add(year)
+        self.last_page_years = dict(
+            courses.values_list("code", "last_course_page_year")
+        )
+
+        self.lock = threading.Lock()
+        self.new_misses = set()
+
+    def get_years(self, code: str, years: List[int]):
+        """
+        Order and filter years to probe: the last year with a page first, without years which recently had none.
+        At most as many years as given are probed.
+        """
+        try_limit = len(years)
+        missed_years = self.missed_years.get(code, set())
+        last_page_year = self.last_page_years.get(code)
+        if last_page_year:
+            years = [last_page_year] + [
+                year for year in years if year != last_page_year
+            ]
+        return [year for year in years if year not in missed_years][:try_limit]
+
+    def add_miss(self, code: str, year: int):
+        with self.lock:
+            self.missed_years[code].add(year)
+            self.new_misses.add((code, year))
+
+    def add_hit(self, code: str, year: int):
+        with self.lock:
+            self.last_page_years[code] = year
+
+    def discard_saved(self, saved_misses: set):
+        with self.lock:
+            self.new_misses -= saved_misses
+
+    def save(self):
+        with self.lock:
+            new_misses = set(self.new_misses)
+
+        checked_date = timezone.now()
+        CoursePageMiss.objects.bulk_create(
+            [
+                CoursePageMiss(course_code=code, year=year, checked_date=checked_date)
+                for code, year in new_misses
+            ],
+            update_conflicts=True,
+            unique_fields=["course_code", "year"],
+            update_fields=["checked_date"],
+            batch_size=500,
+        )
+        transaction.on_commit(lambda: self.discard_saved(new_misses))
@@ -1,11 +1,18 @@
 from datetime import datetime
+
 from clients.nsd import NSDCourseClient, NSDGradeClient
 from clients.course_pages import CoursePagesClient
+from clients.dbh_records import sort_rows_by_version
+from clients.metrics import metrics
+from services.course_page_probes import CoursePageProbes
+from services.dbh_index import DBHIndex
 
 
-from typing import List
+from typing import Dict, List
 
-from grades.models import Course, Faculty, Department
+from grades.models import Course
+from grades.search_adapters import update_courses_search_index
+from grades.org_units import OrganizationUnitResolver
 
 
 class CourseService:
@@ -14,10 +21,24 @@ class CourseService:
     course_client = NSDCourseClient()
     grade_client = NSDGradeClient()
     course_page_client = CoursePagesClient()
+    # Set to share the course page misses of a sync between courses, and save them along with the courses
+    course_page_probes: CoursePageProbes = None
+    # Set to share the English names of existing courses between courses of a sync, by course code
+    english_names: Dict[str, str] = None
+    # Flags which are also set from other sources than the course data, like the grades checked by
+    # DigitalExamService, so course data never clears them
+    sticky_flags = ("has_had_digital_exam",)
 
     def exclude_empty_values(self, data):
         return {k: v for k, v in data.items() if v not in [None, ""]}
 
+    def exclude_cleared_flags(self, data):
+        return {
+            k: v
+            for k, v in data.items()
+            if v is not False or k not in self.sticky_flags
+        }
+
     def get_taught_to(
         self, code, course_data: List[dict] = None, grades: List[dict] = None
     ):
@@ -71,34 +92,20 @@ class CourseService:
         return min(first_grade_year, first_course_year)
 
     def get_faculty_and_department(
-        self,
-        faculty_code,
-        faculties: List[Faculty] = None,
-        departments: List[Department] = None,
+        self, faculty_code, org_units: OrganizationUnitResolver = None
     ):
-        if not faculty_code:
-            return None, None
-
-        nsd_code = f"1150{faculty_code}"
-
-        def get_first_from_queryset(queryset):
-            return queryset.filter(nsd_code=nsd_code).first()
-
-        department = get_first_from_queryset(departments or Department.objects)
-        faculty = get_first_from_queryset(faculties or Faculty.objects)
-
-        if department and not faculty:
-            faculty = department.faculty
-
-        return faculty, department
-
-    def get_course_data_from_course_pages(
-        self, code, taught_from: int, last_year_taught: int
+        if org_units is None:
+            if not faculty_code:
+                return None, None
+            org_units = OrganizationUnitResolver.for_faculty_code(faculty_code)
+        return org_units.get_faculty_and_department(faculty_code)
+
+    def get_course_page_years(
+        self, taught_from: int, last_year_taught: int, existing: bool
     ):
-        data = self.course_page_client.get_course_data(code)
-        if data:
-            return data
-
+        """
+        Years to probe the course pages of, from the newest, when the current page has no course info.
+        """
         default_end_year = 2000
 
         start_year = last_year_taught
@@ -109,22 +116,46 @@ class CourseService:
         if end_year == 0 or end_year > start_year:
             end_year = max(start_year - 5, default_end_year)
 
-        try_limit = 6
-
         # For existing courses, older years will have been scraped previously
-        existing_course = Course.all_objects.filter(code=code)
-        if existing_course:
-            try_limit = 2
+        try_limit = 2 if existing else 6
+
+        return list(range(start_year, end_year - 1, -1))[:try_limit]
+
+    def get_english_name(self, code: str):
+        """
+        The English name of an existing course, so the English course page is only fetched when needed.
+        """
+        if self.english_names is not None:
+            return self.english_names.get(code)
+        return (
+            Course.all_objects.filter(code=code)
+            .values_list("english_name", flat=True)
+            .first()
+        )
 
-        for try_count, year in enumerate(range(start_year, end_year - 1, -1), start=1):
-            if try_count > try_limit:
-                return None
+    def get_course_data_from_course_pages(
+        self, code, taught_from: int, last_year_taught: int
+    ):
+        english_name = self.get_english_name(code)
+        data = self.course_page_client.get_course_data(code, english_name=english_name)
+        if data:
+            data["last_course_page_year"] = 0
+            return data
 
-            data = self.course_page_client.get_course_data(code, year)
+        probes = self.course_page_probes or CoursePageProbes([code])
+        existing = Course.all_objects.filter(code=code).exists()
+        years = self.get_course_page_years(taught_from, last_year_taught, existing)
+        for year in probes.get_years(code, years):
+            data = self.course_page_client.get_course_data(code, year, english_name)
             if data:
-                return data
+                data["last_course_page_year"] = year
+                probes.add_hit(code, year)
+                break
+            probes.add_miss(code, year)
 
-        return None
+        if probes is not self.course_page_probes:
+            probes.save()
+        return data
 
     def parse_dbh_course(self, dbh_course: List[dict], code: str):
         if not dbh_course:
@@ -146,46 +177,47 @@ class CourseService:
             "place": "",
         }
 
-    def get_course_data(
-        self,
-        code: str,
-        all_courses: List[dict] = None,
-        all_grades: List[dict] = None,
-        faculties: List[Faculty] = None,
-        departments: List[Department] = None,
-    ):
-        all_courses = all_courses or []
-        all_grades = all_grades or []
+    def get_dbh_course_data(self, code: str, dbh_index: DBHIndex = None):
+        """
+        Get the DBH rows of a course, and the years it was taught according to them.
+        """
+        dbh_index = dbh_index or DBHIndex()
 
-        dbh_grades = [grade for grade in all_grades if f"{code}-" in grade["Emnekode"]]
-        dbh_course = [
-            course for course in all_courses if f"{code}-" in course["Emnekode"]
-        ]
+        dbh_grades = dbh_index.get_grades(code)
+        dbh_course = dbh_index.get_courses(code)
 
         dbh_course = dbh_course or self.course_client.get_course(code)
         dbh_grades = dbh_grades or self.grade_client.get_grades_for_course(code)
+        # The last row of the highest version of the course is used as its course data
+        dbh_course = sort_rows_by_version(dbh_course)
 
         taught_from = self.get_taught_from(code, dbh_grades, dbh_course)
         last_year_taught = self.get_taught_to(code, dbh_course, dbh_grades)
         if taught_from > last_year_taught:
             last_year_taught = 0
 
-        data = self.get_course_data_from_course_pages(
-            code, taught_from, last_year_taught
-        )
+        return dbh_course, taught_from, last_year_taught
 
+    def complete_course_data(
+        self,
+        code: str,
+        data,
+        dbh_course: List[dict],
+        taught_from: int,
+        last_year_taught: int,
+        org_units: OrganizationUnitResolver = None,
+    ):
         if not data:
             if not dbh_course:
                 print(f"No data found for course {code}")
                 return None
 
             print("Using course data from DBH")
+            metrics.increment("courses_from_dbh")
             data = self.parse_dbh_course(dbh_course, code)
 
         faculty_code = dbh_course[-1].get("Avdelingskode", None) if dbh_course else None
-        faculty, department = self.get_faculty_and_department(
-            faculty_code, faculties, departments
-        )
+        faculty, department = self.get_faculty_and_department(faculty_code, org_units)
 
         if faculty:
             data["faculty_code"] = faculty.faculty_id
@@ -198,21 +230,73 @@ class CourseService:
 
         return data
 
-    def create_or_update_course_from_data(self, data):
-        course_code = data["code"]
-        existing_course = Course.all_objects.filter(code=course_code)
+    def get_course_data(
+        self,
+        code: str,
+        dbh_index: DBHIndex = None,
+        org_units: OrganizationUnitResolver = None,
+    ):
+        dbh_course, taught_from, last_year_taught = self.get_dbh_course_data(
+            code, dbh_index
+        )
+        with metrics.timer("course_pages"):
+            data = self.get_course_data_from_course_pages(
+                code, taught_from, last_year_taught
+            )
+        return self.complete_course_data(
+            code,
+            data,
+            dbh_course,
+            taught_from,
+            last_year_taught,
+            org_units,
+        )
+
+    def create_or_update_courses_from_data(
+        self, courses_data: List[dict], batch_size: int = 500
+    ) -> Dict[str, Course]:
+        """
+        Upsert any number of courses at once, and return them by code.
+        New courses are inserted and existing courses updated in a statement per `batch_size` courses.
+        """
+        courses_data = {data["code"]: data for data in courses_data}
+        courses = {
+            course.code: course
+            for course in Course.all_objects.filter(code__in=courses_data)
+        }
+
+        new_courses = []
+        existing_courses = []
+        update_fields = set()
+        for course_code, data in courses_data.items():
+            course = courses.get(course_code)
+            if course is None:
+                print(f"Creating new course with code: {course_code}")
+                courses[course_code] = Course(**data)
+                new_courses.append(courses[course_code])
+                continue
 
-        if existing_course.exists():
             # Avoid overriding fields with empty values
-            data = self.exclude_empty_values(data)
+            data = self.exclude_cleared_flags(self.exclude_empty_values(data))
 
             print(f"Updating existing course with code: {course_code}")
-            existing_course.update(**data)
-            return existing_course.first()
-        else:
-            print(f"Creating new course with code: {course_code}")
-            new_course = Course.objects.create(**data)
-            return new_course
+            for field, value in data.items():
+                setattr(course, field, value)
+            existing_courses.append(course)
+            update_fields.update(data)
+
+        Course.all_objects.bulk_create(new_courses, batch_size=batch_size)
+        update_fields.discard("code")
+        if existing_courses and update_fields:
+            Course.all_objects.bulk_update(
+                existing_courses, update_fields, batch_size=batch_size
+            )
+
+        update_courses_search_index(new_courses + existing_courses)
+        return courses
+
+    def create_or_update_course_from_data(self, data):
+        return self.create_or_update_courses_from_data([data])[data["code"]]
 
     def create_or_update_course(self, code):
         data = self.get_course_data(code)
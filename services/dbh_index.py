@@ -0,0 +1,36 @@
+from collections import defaultdict
+from typing import Iterable, List
+
+from clients.dbh_records import get_base_course_code
+
+
+class DBHIndex:
+    """
+    The DBH course and grade tables indexed by course code without version number.
+
+    Built once per sync, so looking up the rows for a single course does not scan the whole tables.
+    Rows keep the order they were given in.
+    """
+
+    def __init__(self, courses: Iterable[dict] = (), grades: Iterable[dict] = ()):
+        self.courses = self.index_rows(courses)
+        self.grades = self.index_rows(grades)
+
+    @staticmethod
+    def index_rows(rows: Iterable[dict]):
+        index = defaultdict(list)
+        for row in rows:
+            index[get_base_course_code(row["Emnekode"])].append(row)
+        return dict(index)
+
+    def get_courses(self, code: str) -> List[dict]:
+        return self.courses.get(code, [])
+
+    def get_grades(self, code: str) -> List[dict]:
+        return self.grades.get(code, [])
+
+    def iter_grades(self):
+        """
+        Yield (course code, grade rows) for every course with grades, with the rows of all its versions.
+        """
+        yield from self.grades.items()
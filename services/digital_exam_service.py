@@ -0,0 +1,136 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from clients.course_pages import CoursePagesClient
+from clients.metrics import metrics
+from clients.throttle import HostThrottle
+from grades.models import Course, Grade, Semester
+
+
+class DigitalExamService:
+    """
+    Reads from the exam table of the course pages whether the exams of each semester were digital, and writes
+    it to Grade.digital_exam and Course.has_had_digital_exam.
+
+    Only grades which have not been checked yet are read, so every course page of a year is fetched once.
+    The pages of every course and year are fetched by `workers` threads, at most `per_host_limit` at a time
+    and `rate` requests per second. Grades of pages which could not be fetched are tried again in the next run, as are
+    grades of the last study years when their page has no exam table yet.
+    """
+
+    # The term of a semester in the exam table, and how many years after its study year the semester is.
+    # The course page of a year describes the study year starting that autumn.
+    semester_terms = {
+        Semester.AUTUMN: ("Høst", 0),
+        Semester.SPRING: ("Vår", 1),
+        Semester.SUMMER: ("Sommer", 1),
+    }
+
+    def __init__(
+        self,
+        workers: int = 8,
+        rate: float = 20.0,
+        per_host_limit: int = 4,
+        batch_size: int = 500,
+    ):
+        self.workers = workers
+        self.rate = rate
+        self.per_host_limit = per_host_limit
+        self.batch_size = batch_size
+
+    def get_study_year(self, year: int, semester: str):
+        _, offset = self.semester_terms[semester]
+        return year - offset
+
+    def get_pages(self, include: Callable[[str], bool] = None):
+        """
+        The unchecked grades of every course page, by the course code and study year of the page.
+        """
+        pages: Dict[Tuple[str, int], List[tuple]] = defaultdict(list)
+        grades = Grade.all_objects.filter(digital_exam_checked=False).values_list(
+            "id", "course_id", "course__code", "year", "semester"
+        )
+        for grade_id, course_id, code, year, semester in grades.iterator():
+            if semester not in self.semester_terms:
+                continue
+            if include is not None and not include(code):
+                continue
+            study_year = self.get_study_year(year, semester)
+            pages[(code, study_year)].append((grade_id, course_id, semester))
+        return pages
+
+    def fetch_exam_terms(self, pages: Dict[Tuple[str, int], List[tuple]]):
+        client = CoursePagesClient()
+        client.throttle = HostThrottle(
+            max_concurrent=self.per_host_limit, rate=self.rate
+        )
+
+        def fetch(page: Tuple[str, int]):
+            code, year = page
+            try:
+                with metrics.timer("exam_page_fetch"):
+                    return client.get_exam_terms(code, year)
+            except Exception as error:
+                print(f"Failed to fetch exams of {code} {year}: {error!r}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            exam_terms = list(executor.map(fetch, pages))
+        return dict(zip(pages, exam_terms))
+
+    def write(
+        self,
+        pages: Dict[Tuple[str, int], List[tuple]],
+        exam_terms: Dict[Tuple[str, int], dict],
+    ):
+        current_year = timezone.now().year
+        grades = []
+        digital_course_ids = set()
+        for page, page_grades in pages.items():
+            terms = exam_terms.get(page)
+            if terms is None:
+                continue
+            _, year = page
+            # The exam tables of the last study years may not be filled in yet
+            if not terms and year >= current_year - 1:
+                continue
+            for grade_id, course_id, semester in page_grades:
+                term, _ = self.semester_terms[semester]
+                digital_exam = terms.get(term, False)
+                grades.append(
+                    Grade(
+                        id=grade_id,
+                        digital_exam=digital_exam,
+                        digital_exam_checked=True,
+                    )
+                )
+                if digital_exam:
+                    digital_course_ids.add(course_id)
+
+        with transaction.atomic():
+            Grade.all_objects.bulk_update(
+                grades,
+                ["digital_exam", "digital_exam_checked"],
+                batch_size=self.batch_size,
+            )
+            Course.all_objects.filter(id__in=digital_course_ids).update(
+                has_had_digital_exam=True
+            )
+        return len(grades)
+
+    def run(self, include: Callable[[str], bool] = None):
+        """
+        Check the unchecked grades of every course, or of the courses with a code `include` returns True for.
+        """
+        with metrics.timer("digital_exams"):
+            pages = self.get_pages(include)
+            print(f"Checking digital exams of {len(pages)} course pages")
+            exam_terms = self.fetch_exam_terms(pages)
+            checked = self.write(pages, exam_terms)
+        metrics.increment("digital_exam_grades_checked", checked)
+        print(f"Checked digital exams of {checked} grades")
+        return checked
@@ -3,6 +3,7 @@ from operator import itemgetter
 
 from grades.models import Semester, Course, Grade
 
+from clients.metrics import metrics
 from clients.nsd import NSDGradeClient
 
 from services.course_service import CourseService
@@ -20,18 +21,25 @@ class GradeService:
     }
 
     def get_grade_data_for_semester(
-        self, code, year, semester: Semester, grades: List[dict] = None
+        self,
+        code,
+        year,
+        semester: Semester,
+        grades: List[dict] = None,
+        course_id: int = None,
     ):
         if not grades:
             grades = self.grade_client.get_grades_for_semester(code, year, semester)
 
         grade_data = self.grade_client.build_grade_data_from_results(
-            grades, code, year, semester
+            grades, code, year, semester, course_id
         )
 
         return grade_data
 
-    def get_grades_data_for_course(self, course_code, nsd_grades: List[dict] = None):
+    def get_grades_data_for_course(
+        self, course_code, nsd_grades: List[dict] = None, course_id: int = None
+    ):
         if nsd_grades is None:
             nsd_grades = self.grade_client.get_grades_for_course(course_code)
 
@@ -42,7 +50,11 @@ class GradeService:
 
         grades_data = [
             self.get_grade_data_for_semester(
-                course_code, year, self.semester_map[semester_key], list(grade)
+                course_code,
+                year,
+                self.semester_map[semester_key],
+                list(grade),
+                course_id,
             )
             for (year, semester_key), grade in groupby(
                 nsd_grades, key=itemgetter("Årstall", "Semester")
@@ -70,26 +82,47 @@ class GradeService:
 
         return self.grade_client.build_grade_from_data(grade_data)
 
-    def create_or_update_grades_for_course(
-        self, course_code, nsd_grades: List[dict] = None
+    def get_new_grades_data_for_course(
+        self, course_code, nsd_grades: List[dict] = None, course_id: int = None
     ):
-        if not Course.all_objects.filter(code=course_code).exists():
-            raise ValueError(f"Course {course_code} does not exist")
-
-        grades_data = self.get_grades_data_for_course(course_code, nsd_grades)
-        grades_data = self.filter_out_conflicting_grades(
-            grades_data, Grade.all_objects.filter(course__code=course_code)
+        """
+        Grade data for every semester of the course which doesn't conflict with existing grades.
+        """
+        if course_id is None:
+            course_id = self.grade_client.get_course_id(course_code)
+
+        grades_data = self.get_grades_data_for_course(
+            course_code, nsd_grades, course_id
         )
+        with metrics.timer("grade_conflict_filter"):
+            return self.filter_out_conflicting_grades(
+                grades_data, Grade.all_objects.filter(course_id=course_id)
+            )
+
+    def create_or_update_grades_for_course(
+        self, course_code, nsd_grades: List[dict] = None, bulk: bool = False
+    ):
+        grades_data = self.get_new_grades_data_for_course(course_code, nsd_grades)
 
         if not grades_data:
             print(f"Course {course_code} has no grades")
             return []
 
+        if bulk:
+            return self.create_or_update_grades(grades_data)
+
         return [
             self.grade_client.build_grade_from_data(grade_data)
             for grade_data in grades_data
         ]
 
+    def create_or_update_grades(self, grades_data: List[dict]):
+        """
+        Upsert grades data for any number of courses at once.
+        """
+        with metrics.timer("grade_upsert"):
+            return self.grade_client.build_grades_from_data(grades_data)
+
     def filter_out_conflicting_grades(
         self, grades_data: List[dict], existing_grades_data: List[Grade]
     ):
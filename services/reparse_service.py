@@ -0,0 +1,127 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from django.db import transaction
+
+from clients import reparse
+from clients.client import Client
+from clients.metrics import metrics
+from clients.page_archive import PageArchive
+from grades.models import Course
+from services.course_service import CourseService
+
+
+class ReparseReport:
+    def __init__(self):
+        self.updated = 0
+        self.missing = 0
+        self.failed = 0
+
+    def __str__(self):
+        return (
+            f"Updated {self.updated} courses from archived pages "
+            f"({self.missing} without course info, {self.failed} failed)"
+        )
+
+
+class ReparseService:
+    """
+    Extracts the course data of existing courses again from the pages in a PageArchive, and updates the
+    courses with it. Nothing is requested, so changes to the extraction of CoursePagesClient can be applied
+    to every course without fetching the course pages again.
+
+    Pages are parsed by `processes` worker processes, every core by default, and the courses are written by
+    the calling process in batches of `batch_size`.
+
+    Only the fields read from the course pages are written, the years taught are kept from DBH. The data
+    fingerprint of the courses is cleared, so the next sync of a course writes all of its course data.
+    """
+
+    course_service = CourseService()
+    # Course data which the sync takes from DBH, see CourseService.complete_course_data. The values extracted
+    # from the course pages are placeholders.
+    dbh_fields = ("taught_from", "last_year_taught")
+
+    def __init__(
+        self,
+        archive_directory: str,
+        processes: int = None,
+        batch_size: int = 500,
+        chunk_size: int = 16,
+    ):
+        self.archive_directory = archive_directory
+        self.processes = processes or os.cpu_count()
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def get_courses(self, codes: List[str] = None):
+        """
+        The code and English name of the existing courses with archived pages, or of `codes`.
+        """
+        archive = PageArchive(self.archive_directory)
+        try:
+            archived_codes = set(archive.get_codes())
+        finally:
+            archive.close()
+        if codes is not None:
+            archived_codes &= set(codes)
+        return list(
+            Course.all_objects.filter(code__in=archived_codes)
+            .order_by("code")
+            .values_list("code", "english_name")
+        )
+
+    def write(self, batch: List[dict], report: ReparseReport):
+        if not batch:
+            return
+
+        courses_data = [
+            {
+                field: value
+                for field, value in data.items()
+                if field not in self.dbh_fields
+            }
+            for data in batch
+        ]
+        with transaction.atomic():
+            self.course_service.create_or_update_courses_from_data(
+                courses_data, batch_size=self.batch_size
+            )
+            Course.all_objects.filter(
+                code__in=[data["code"] for data in courses_data]
+            ).update(data_fingerprint="")
+        report.updated += len(batch)
+
+    def run(self, codes: List[str] = None):
+        report = ReparseReport()
+        courses = self.get_courses(codes)
+        print(f"Reparsing {len(courses)} courses with {self.processes} processes")
+
+        with (
+            metrics.timer("reparse"),
+            ProcessPoolExecutor(
+                max_workers=self.processes,
+                initializer=reparse.init_worker,
+                initargs=(self.archive_directory, Client.html_parser),
+            ) as executor,
+        ):
+            batch = []
+            for code, data, error in executor.map(
+                reparse.reparse_course, courses, chunksize=self.chunk_size
+            ):
+                if error:
+                    print(f"Failed to reparse course {code}: {error}")
+                    report.failed += 1
+                    continue
+                if not data:
+                    report.missing += 1
+                    continue
+
+                batch.append(data)
+                if len(batch) >= self.batch_size:
+                    self.write(batch, report)
+                    batch = []
+
+            self.write(batch, report)
+        return report
@@ -0,0 +1,153 @@
+import codecs
+import gzip
+import json
+import os
+import time
+import uuid
+from typing import Iterable, Mapping
+
+from clients.dbh_records import iter_dbh_records
+from clients.files import atomic_write
+
+
+class SyncCheckpoint:
+    """
+    Progress of a sync run, persisted in `directory` so a crashed or killed run can be resumed.
+
+    The checkpoint stores the run id, the last committed course code and the status of every course handled
+    so far. The DBH tables downloaded by the run are stored next to it, so a resumed run syncs the same data.
+
+    Shards of a sync each have their own named checkpoint, and share the DBH tables in the directory.
+    """
+
+    WRITTEN = "written"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+    # Courses which are not synced again when resuming
+    DONE = {WRITTEN, SKIPPED}
+
+    default_name = "checkpoint"
+
+    def __init__(self, directory: str, run_id: str = None, name: str = default_name):
+        self.directory = directory
+        self.name = name
+        self.run_id = run_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self.finished_at = None
+        self.last_course_code = None
+        self.statuses = {}
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"{self.name}.json")
+
+    @staticmethod
+    def get_shard_name(shard_index: int, shard_count: int):
+        return f"checkpoint-{shard_index}-of-{shard_count}"
+
+    def is_stale_file(self, file_name: str):
+        if file_name == f"{self.name}.json":
+            return True
+        # Only a run of the whole sync replaces the DBH tables and the checkpoints of its shards
+        return self.name == self.default_name and (
+            file_name.endswith(".json.gz")
+            or (file_name.startswith("checkpoint-") and file_name.endswith(".json"))
+        )
+
+    @classmethod
+    def start(cls, directory: str, name: str = default_name):
+        """
+        Start a new run, discarding the checkpoint and DBH tables of any previous run.
+        A new run of a shard keeps the DBH tables.
+        """
+        checkpoint = cls(directory, name=name)
+        for file_name in os.listdir(directory) if os.path.isdir(directory) else []:
+            if checkpoint.is_stale_file(file_name):
+                os.remove(os.path.join(directory, file_name))
+        checkpoint.save()
+        return checkpoint
+
+    @classmethod
+    def resume(cls, directory: str, name: str = default_name):
+        """
+        Load the checkpoint of the last run, or start a new run when there is none or the last run finished.
+        """
+        try:
+            with open(
+                os.path.join(directory, f"{name}.json"), encoding="utf-8"
+            ) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            print(f"No sync to resume in {directory}, starting a new sync")
+            return cls.start(directory, name)
+
+        if data["finished_at"] is not None:
+            print(
+                f"Sync {data['run_id']} in {directory} is finished, starting a new sync"
+            )
+            return cls.start(directory, name)
+
+        checkpoint = cls(directory, data["run_id"], name)
+        checkpoint.started_at = data["started_at"]
+        checkpoint.finished_at = data["finished_at"]
+        checkpoint.last_course_code = data["last_course_code"]
+        checkpoint.statuses = data["statuses"]
+        return checkpoint
+
+    def save(self):
+        data = {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "last_course_code": self.last_course_code,
+            "statuses": self.statuses,
+        }
+        with atomic_write(self.path) as checkpoint_file:
+            checkpoint_file.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def finish(self):
+        self.finished_at = time.time()
+        self.save()
+
+    def is_done(self, code: str):
+        return self.statuses.get(code) in self.DONE
+
+    def mark(self, code: str, status: str):
+        self.statuses[code] = status
+
+    def commit(self, codes: Iterable[str]):
+        """
+        Mark courses written to the database, and save the checkpoint.
+        """
+        for code in codes:
+            self.mark(code, self.WRITTEN)
+            self.last_course_code = code
+        self.save()
+
+    def get_table_path(self, name: str):
+        return os.path.join(self.directory, f"{name}.json.gz")
+
+    def has_table(self, name: str):
+        return os.path.exists(self.get_table_path(name))
+
+    def save_table(self, name: str, rows: Iterable[Mapping]):
+        """
+        Store a downloaded DBH table for this run, as a gzipped JSON array of rows.
+        """
+        with atomic_write(self.get_table_path(name)) as temporary_file:
+            with gzip.open(temporary_file, "wt", encoding="utf-8") as table_file:
+                table_file.write("[")
+                for index, row in enumerate(rows):
+                    if index:
+                        table_file.write(",\n")
+                    table_file.write(json.dumps(dict(row), ensure_ascii=False))
+                table_file.write("]")
+
+    def load_table(self, name: str, chunk_size: int = 64 * 1024):
+        """
+        Load a stored DBH table, with the rows as DBHRecords like the streaming clients return them.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with gzip.open(self.get_table_path(name), "rb") as table_file:
+            chunks = iter(lambda: decoder.decode(table_file.read(chunk_size)), "")
+            return list(iter_dbh_records(chunks))
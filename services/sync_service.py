@@ -0,0 +1,492 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+from queue import Empty, Queue
+from typing import List, Tuple
+
+from django.db import connection, transaction
+
+from clients.course_pages import CoursePagesClient
+from clients.metrics import metrics
+from clients.nsd import NSDCourseClient, NSDGradeClient
+from clients.throttle import HostThrottle
+from grades.models import Course, Faculty, Department
+from grades.org_units import OrganizationUnitResolver
+from grades.utils import defer_course_stats
+from services.course_page_probes import CoursePageProbes
+from services.course_service import CourseService
+from services.dbh_index import DBHIndex
+from services.digital_exam_service import DigitalExamService
+from services.grade_service import GradeService
+from services.sync_checkpoint import SyncCheckpoint
+
+
+def serialize(data):
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def get_fingerprint(data):
+    return hashlib.sha256(serialize(data).encode("utf-8")).hexdigest()
+
+
+def get_shard(code: str, shard_count: int):
+    """
+    The shard of a course code. Stable between processes and machines, unlike hash().
+    """
+    return zlib.crc32(code.encode("utf-8")) % shard_count
+
+
+class SyncReport:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.failed = 0
+        self.resumed = 0
+        self.grades = 0
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def courses_per_second(self):
+        if self.elapsed == 0:
+            return 0.0
+        processed = self.created + self.updated + self.skipped + self.failed
+        return processed / self.elapsed
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "resumed": self.resumed,
+            "grades": self.grades,
+            "elapsed": self.elapsed,
+            "courses_per_second": self.courses_per_second,
+        }
+
+    def __str__(self):
+        return (
+            f"Created {self.created} and updated {self.updated} courses with {self.grades} grades "
+            f"in {self.elapsed:.1f}s ({self.unchanged} unchanged, {self.skipped} skipped, "
+            f"{self.failed} failed, {self.resumed} done before resuming), "
+            f"{self.courses_per_second:.2f} courses/s"
+        )
+
+
+class CourseSyncTask:
+    def __init__(self, code: str, grades: List[dict], dbh_fingerprint: str):
+        self.code = code
+        self.grades = grades
+        self.dbh_fingerprint = dbh_fingerprint
+        self.course_data = None
+        self.error = None
+
+
+class SyncService:
+    """
+    Syncs courses and grades from DBH and the course pages.
+
+    Course data is fetched by a pool of worker threads, since most of the time is spent
+    waiting on HTTP. The requests to each host are limited to `per_host_limit` at a time, started at least
+    `per_host_interval` seconds apart, and with a `rate`, to `rate` per second. All database writes are done
+    by the calling thread.
+
+    Courses are skipped when their DBH rows are unchanged since the last sync, unless `full` is set.
+    Courses whose course data is unchanged only get their grades written. With `partial`, the DBH tables
+    only have some of the years, so their rows can't be compared with those of the last sync. Every course
+    is then synced, and keeps the DBH fingerprint of the last full sync.
+
+    With a `checkpoint`, the status of every course is recorded as the sync goes, and courses which were
+    already written or skipped in the run of the checkpoint are not synced again.
+
+    With a `shard` of (index, count), only the courses of that shard are synced, so several processes or
+    machines can each sync a disjoint part of the courses against the same database.
+
+    With `digital_exams`, the grades whose exam type is not known yet are checked for digital exams after
+    the courses are written, see DigitalExamService.
+    """
+
+    # Seconds the writer waits for a fetched course before checking that the fetchers are still running
+    result_poll_interval = 1.0
+
+    def __init__(
+        self,
+        workers: int = 8,
+        per_host_limit: int = 4,
+        per_host_interval: float = 0.0,
+        batch_size: int = 50,
+        full: bool = False,
+        partial: bool = False,
+        rate: float = None,
+        checkpoint: SyncCheckpoint = None,
+        shard: Tuple[int, int] = None,
+        digital_exams: bool = False,
+    ):
+        self.workers = workers
+        self.per_host_limit = per_host_limit
+        self.rate = rate
+        self.checkpoint = checkpoint
+        self.shard = shard
+        self.digital_exams = digital_exams
+        self.batch_size = batch_size
+        self.full = full
+        self.partial = partial
+        self.throttle = HostThrottle(
+            max_concurrent=per_host_limit, min_interval=per_host_interval, rate=rate
+        )
+        # A course service with clients of its own, so the throttle and the state of a sync never leak into
+        # other users of CourseService
+        self.course_service = CourseService()
+        self.course_service.course_client = NSDCourseClient()
+        self.course_service.grade_client = NSDGradeClient()
+        self.course_service.course_page_client = CoursePagesClient()
+        for client in (
+            self.course_service.course_client,
+            self.course_service.grade_client,
+            self.course_service.course_page_client,
+        ):
+            client.throttle = self.throttle
+        self.grade_service = GradeService()
+        # Course code -> (id, DBH fingerprint, data fingerprint)
+        self.synced_courses = {}
+
+    @staticmethod
+    def validate_course_code(code):
+        return re.match(r"^[a-zA-Z0-9-_\sæøåÆØÅ]+$", code)
+
+    @staticmethod
+    def get_english_names():
+        return dict(
+            Course.all_objects.exclude(english_name="").values_list(
+                "code", "english_name"
+            )
+        )
+
+    @staticmethod
+    def get_synced_courses():
+        return {
+            code: (course_id, dbh_fingerprint, data_fingerprint)
+            for course_id, code, dbh_fingerprint, data_fingerprint in (
+                Course.all_objects.values_list(
+                    "id", "code", "dbh_fingerprint", "data_fingerprint"
+                )
+            )
+        }
+
+    @staticmethod
+    def get_dbh_fingerprint(code: str, dbh_index: DBHIndex):
+        """
+        The fingerprint of the DBH rows of a course. The rows are sorted, since DBH does not return them in
+        the same order every time.
+        """
+        return get_fingerprint(
+            [
+                sorted(serialize(dict(row)) for row in dbh_index.get_courses(code)),
+                sorted(serialize(dict(row)) for row in dbh_index.get_grades(code)),
+            ]
+        )
+
+    def is_in_shard(self, code: str):
+        shard_index, shard_count = self.shard
+        return get_shard(code, shard_count) == shard_index
+
+    def get_tasks(self, dbh_index: DBHIndex, report: SyncReport):
+        tasks = []
+        # Every version of a course code, e.g. TDT4100-1 and TDT4100-2, is synced once as TDT4100
+        for course_code, course_grades in dbh_index.iter_grades():
+            # Don't sync courses with special-character codes
+            if not self.validate_course_code(course_code):
+                print(f"Course {course_code} has invalid code. Skipping")
+                continue
+
+            if self.shard and not self.is_in_shard(course_code):
+                continue
+            if self.checkpoint and self.checkpoint.is_done(course_code):
+                report.resumed += 1
+                continue
+
+            _, synced_dbh_fingerprint, _ = self.synced_courses.get(
+                course_code, (None, "", "")
+            )
+            if self.partial:
+                tasks.append(
+                    CourseSyncTask(course_code, course_grades, synced_dbh_fingerprint)
+                )
+                continue
+
+            dbh_fingerprint = self.get_dbh_fingerprint(course_code, dbh_index)
+            if not self.full and dbh_fingerprint == synced_dbh_fingerprint:
+                report.unchanged += 1
+                continue
+
+            tasks.append(CourseSyncTask(course_code, course_grades, dbh_fingerprint))
+        return tasks
+
+    def fetch_course_data(
+        self,
+        task_queue: Queue,
+        result_queue: Queue,
+        dbh_index: DBHIndex,
+        org_units: OrganizationUnitResolver,
+    ):
+        try:
+            while True:
+                task = task_queue.get()
+                if task is None:
+                    return
+
+                print(f"Syncing course {task.code}")
+                try:
+                    with metrics.timer("course_fetch"):
+                        task.course_data = self.course_service.get_course_data(
+                            task.code, dbh_index, org_units
+                        )
+                except Exception as error:
+                    task.error = error
+                result_queue.put(task)
+        finally:
+            # Worker threads get their own database connection, which is not closed by Django
+            connection.close()
+
+    @staticmethod
+    def run_fetcher(result_queue: Queue, fetch, *args):
+        """
+        Run a fetcher, putting the error on `result_queue` when it fails, so the writer stops waiting for the
+        tasks it would have fetched.
+        """
+        try:
+            fetch(*args)
+        except Exception as error:
+            result_queue.put(error)
+
+    def get_result(self, result_queue: Queue, threads: List[threading.Thread]):
+        """
+        The next fetched task. Raises when a fetcher failed, or when every fetcher stopped with tasks left.
+        """
+        while True:
+            try:
+                result = result_queue.get(timeout=self.result_poll_interval)
+            except Empty:
+                # A stopped fetcher has put all of its tasks, so an empty queue means they are lost
+                if (
+                    not any(thread.is_alive() for thread in threads)
+                    and result_queue.empty()
+                ):
+                    raise RuntimeError(
+                        "The fetchers stopped before every course was fetched"
+                    )
+                continue
+            if isinstance(result, Exception):
+                raise RuntimeError("A course data fetcher failed") from result
+            return result
+
+    def start_fetchers(
+        self,
+        tasks: List[CourseSyncTask],
+        result_queue: Queue,
+        dbh_index: DBHIndex,
+        org_units: OrganizationUnitResolver,
+    ):
+        """
+        Start fetching the course data of the tasks in background threads, putting the tasks on `result_queue`
+        when done.
+        """
+        task_queue = Queue()
+        for task in tasks:
+            task_queue.put(task)
+
+        threads = [
+            threading.Thread(
+                target=self.run_fetcher,
+                args=(
+                    result_queue,
+                    self.fetch_course_data,
+                    task_queue,
+                    result_queue,
+                    dbh_index,
+                    org_units,
+                ),
+                daemon=True,
+            )
+            for _ in range(self.workers)
+        ]
+        for thread in threads:
+            task_queue.put(None)
+            thread.start()
+        return threads
+
+    def write_course_batch(self, batch: List[CourseSyncTask]):
+        """
+        Write the courses of a batch with the course data which has changed since the last sync, and return
+        the synced state of each course along with the grades data to write.
+        """
+        course_ids = {}
+        data_fingerprints = {}
+        changed_courses_data = []
+        for task in batch:
+            data_fingerprint = get_fingerprint(task.course_data)
+            course_id, _, synced_data_fingerprint = self.synced_courses.get(
+                task.code, (None, "", "")
+            )
+            course_ids[task.code] = course_id
+            data_fingerprints[task.code] = data_fingerprint
+            if data_fingerprint != synced_data_fingerprint:
+                changed_courses_data.append(
+                    {
+                        **task.course_data,
+                        "data_fingerprint": data_fingerprint,
+                        "dbh_fingerprint": task.dbh_fingerprint,
+                    }
+                )
+
+        changed_courses = self.course_service.create_or_update_courses_from_data(
+            changed_courses_data
+        )
+        course_ids.update((code, course.id) for code, course in changed_courses.items())
+
+        # The batch is written in one transaction, so this is only committed along with the grades
+        Course.all_objects.bulk_update(
+            [
+                Course(id=course_ids[task.code], dbh_fingerprint=task.dbh_fingerprint)
+                for task in batch
+                if task.code not in changed_courses
+            ],
+            ["dbh_fingerprint"],
+        )
+
+        grades_data = []
+        written = {}
+        for task in batch:
+            grades_data.extend(
+                self.grade_service.get_new_grades_data_for_course(
+                    task.code, task.grades, course_ids[task.code]
+                )
+            )
+            written[task.code] = (
+                course_ids[task.code],
+                task.dbh_fingerprint,
+                data_fingerprints[task.code],
+            )
+        return written, grades_data
+
+    def mark(self, code: str, status: str):
+        if self.checkpoint:
+            self.checkpoint.mark(code, status)
+
+    def write_courses(self, batch: List[CourseSyncTask], report: SyncReport):
+        """
+        Write a batch of fetched courses in one transaction. The courses and the grades of every course in the
+        batch are upserted at once. When the batch fails, its courses are written one by one, so a single bad
+        course doesn't fail the others.
+        """
+        if not batch:
+            return
+
+        try:
+            with (
+                metrics.timer("db_write_batch"),
+                transaction.atomic(),
+                defer_course_stats(),
+            ):
+                written, grades_data = self.write_course_batch(batch)
+                grades = self.grade_service.create_or_update_grades(grades_data)
+                self.course_service.course_page_probes.save()
+        except Exception as error:
+            if len(batch) == 1:
+                print(f"Failed to write course {batch[0].code}: {error!r}")
+                report.failed += 1
+                self.mark(batch[0].code, SyncCheckpoint.FAILED)
+                return
+
+            print(f"Failed to write batch of {len(batch)} courses: {error!r}")
+            for task in batch:
+                self.write_courses([task], report)
+            return
+
+        for code, synced_course in written.items():
+            if code in self.synced_courses:
+                report.updated += 1
+            else:
+                report.created += 1
+            self.synced_courses[code] = synced_course
+        report.grades += len(grades)
+        if self.checkpoint:
+            self.checkpoint.commit(written)
+
+    def sync(
+        self,
+        grades: List[dict],
+        courses: List[dict],
+        faculties: List[Faculty] = None,
+        departments: List[Department] = None,
+    ):
+        report = SyncReport()
+        with metrics.timer("dbh_index"):
+            dbh_index = DBHIndex(courses, grades)
+        org_units = OrganizationUnitResolver(faculties, departments)
+        self.synced_courses = self.get_synced_courses()
+        with metrics.timer("sync_plan"):
+            tasks = self.get_tasks(dbh_index, report)
+
+        self.course_service.course_page_probes = CoursePageProbes()
+        self.course_service.english_names = self.get_english_names()
+        try:
+            # Bounded, so the fetchers can't run arbitrarily far ahead of the writer
+            result_queue = Queue(maxsize=self.workers * 4)
+            threads = self.start_fetchers(tasks, result_queue, dbh_index, org_units)
+
+            batch = []
+            for _ in tasks:
+                task = self.get_result(result_queue, threads)
+
+                if task.error:
+                    print(f"Failed to fetch course {task.code}: {task.error!r}")
+                    report.failed += 1
+                    self.mark(task.code, SyncCheckpoint.FAILED)
+                    continue
+
+                if not task.course_data:
+                    print(f"Skipping course {task.code}")
+                    report.skipped += 1
+                    self.mark(task.code, SyncCheckpoint.SKIPPED)
+                    continue
+
+                batch.append(task)
+                if len(batch) >= self.batch_size:
+                    self.write_courses(batch, report)
+                    batch = []
+
+            self.write_courses(batch, report)
+
+            for thread in threads:
+                thread.join()
+
+            # Misses of courses which were skipped after the last batch
+            self.course_service.course_page_probes.save()
+        finally:
+            self.course_service.course_page_probes = None
+            self.course_service.english_names = None
+
+        if self.digital_exams:
+            DigitalExamService(
+                workers=self.workers, rate=self.rate, per_host_limit=self.per_host_limit
+            ).run(include=self.is_in_shard if self.shard else None)
+
+        if self.checkpoint:
+            self.checkpoint.finish()
+        report.finish()
+        return report